@@ -0,0 +1,120 @@
+"""
+Compare pickle against the msgpack serializer, with and without the zstd
+compressor, on payloads shaped like the cached feed pages (ARTICLE_{id}
+dicts) and comment threads (COMMENTS_CACHE_KEY dicts). Reports the bytes
+stored per value and the encode/decode time.
+
+    python benchmarks/cache_serialization.py --comments 500 --body 2000
+"""
+import django_setup  # noqa: F401
+from src.cache_serializers import MsgPackSerializer, ZstdCompressor
+from django_redis.serializers.pickle import PickleSerializer
+from django_redis.compressors.identity import IdentityCompressor
+from django_redis.exceptions import CompressorError
+import argparse
+import random
+import time
+
+
+def make_text(words, length):
+    return " ".join(random.choice(words) for _ in range(length // 6))
+
+
+def make_article(pk, body_length):
+    return {
+        "id": pk,
+        "user": pk % 50,
+        "created_at": "2024-09-01T12:34:56.789012Z",
+        "views_count": random.randint(0, 5000),
+        "comments_count": random.randint(0, 200),
+        "likes_count": random.randint(0, 500),
+        "deleted": False,
+        "edited": False,
+        "title": f"Article {pk} about COMP{1000 + pk % 97}",
+        "body": make_text(["exam", "lecture", "tutor", "assignment"], body_length),
+        "unicon": bool(pk % 2),
+        "user_school": "UNSW",
+        "user_static_points": random.randint(0, 1000),
+        "user_temp_name": f"Happy Koala {pk}",
+        "course_code": f"COMP{1000 + pk % 97}",
+    }
+
+
+def make_thread(comments, body_length):
+    return {
+        "total_comments": comments,
+        "comments": {
+            pk: {
+                "id": pk,
+                "user": pk % 50,
+                "created_at": "2024-09-01T12:34:56.789012Z",
+                "comments_count": random.randint(0, 10),
+                "likes_count": random.randint(0, 50),
+                "deleted": False,
+                "edited": False,
+                "body": make_text(["agree", "thanks", "helpful"], body_length // 4),
+                "article": 1,
+                "parent_comment": None,
+                "user_school": "UNSW",
+                "user_temp_name": f"Calm Wombat {pk}",
+                "user_static_points": random.randint(0, 1000),
+            }
+            for pk in range(comments)
+        },
+    }
+
+
+def run(serializer, compressor, values, repeat):
+    # Same encode/decode path as the django-redis client
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        encoded = [compressor.compress(serializer.dumps(value)) for value in values]
+    encode_time = (time.perf_counter() - start_time) / repeat
+
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        for value in encoded:
+            try:
+                value = compressor.decompress(value)
+            except CompressorError:
+                pass
+            serializer.loads(value)
+    decode_time = (time.perf_counter() - start_time) / repeat
+    return sum(len(value) for value in encoded), encode_time, decode_time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--articles", type=int, default=10)
+    parser.add_argument("--comments", type=int, default=200)
+    parser.add_argument("--body", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--min-length", type=int, default=1024)
+    args = parser.parse_args()
+
+    random.seed(0)
+    payloads = {
+        "feed page": [make_article(pk, args.body) for pk in range(args.articles)],
+        "comment thread": [make_thread(args.comments, args.body)],
+    }
+    options = {"COMPRESS_MIN_LENGTH": args.min_length}
+    configurations = {
+        "pickle": (PickleSerializer(options), IdentityCompressor(options)),
+        "msgpack": (MsgPackSerializer(options), IdentityCompressor(options)),
+        "msgpack + zstd": (MsgPackSerializer(options), ZstdCompressor(options)),
+    }
+
+    for name, values in payloads.items():
+        print(f"{name} ({len(values)} keys):")
+        for label, (serializer, compressor) in configurations.items():
+            size, encode_time, decode_time = run(
+                serializer, compressor, values, args.repeat
+            )
+            print(
+                f"  {label}: {size / 1024:.1f} KB, "
+                f"encode {encode_time * 1000:.2f}ms, decode {decode_time * 1000:.2f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+import os
+import sys
+import django
+
+# Make the Django project importable when running `python benchmarks/<script>.py`
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC_DIR)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "src.settings")
+django.setup()
@@ -0,0 +1,64 @@
+"""
+Compare embedding texts one backend call at a time against the batcher,
+both from concurrent threads and as a single backfill call. Uses the local
+backend unless --backend is given, so it runs without network access.
+
+    python benchmarks/embedding_throughput.py --texts 5000 --threads 32
+"""
+import django_setup  # noqa: F401
+from community.utils.embedding_backends import EMBEDDING_BACKENDS, EmbeddingBatcher
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import time
+
+
+class CountingBackend:
+    def __init__(self, backend):
+        self.backend = backend
+        self.calls = 0
+
+    def embed(self, texts):
+        self.calls += 1
+        return self.backend.embed(texts)
+
+
+def report(label, backend, texts, elapsed):
+    print(
+        f"  {label}: {len(texts) / elapsed:.0f} texts/s, "
+        f"{backend.calls} backend calls in {elapsed:.2f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=list(EMBEDDING_BACKENDS), default="local")
+    parser.add_argument("--texts", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=32)
+    args = parser.parse_args()
+
+    texts = [
+        f"article {i} about course {i % 97} and exam {i % 13}" for i in range(args.texts)
+    ]
+
+    backend = CountingBackend(EMBEDDING_BACKENDS[args.backend]())
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as executor:
+        list(executor.map(lambda text: backend.embed([text]), texts))
+    report("one text per call", backend, texts, time.perf_counter() - start_time)
+
+    backend = CountingBackend(EMBEDDING_BACKENDS[args.backend]())
+    batcher = EmbeddingBatcher(backend)
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as executor:
+        list(executor.map(batcher.embed_queued, texts))
+    report("batched threads", backend, texts, time.perf_counter() - start_time)
+
+    backend = CountingBackend(EMBEDDING_BACKENDS[args.backend]())
+    batcher = EmbeddingBatcher(backend)
+    start_time = time.perf_counter()
+    batcher.embed_many(texts)
+    report("backfill", backend, texts, time.perf_counter() - start_time)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Compare the per-request latency of reading the index from disk on every
+request against the process-resident FaissIndexManager.
+
+    python benchmarks/faiss_index_load.py --sizes 10000 100000 --requests 20
+"""
+import django_setup  # noqa: F401
+from community.constants import EMBEDDING_VECTOR_SIZE, FAISS_UNICON_PARTITION
+from community.utils.embedding_utils import FaissIndexManager
+import numpy as np
+import tempfile
+import argparse
+import faiss
+import time
+import os
+
+
+def build_index_file(path, size):
+    rng = np.random.default_rng(0)
+    index = faiss.IndexIDMap(faiss.IndexFlatL2(EMBEDDING_VECTOR_SIZE))
+    for start in range(0, size, 10000):
+        count = min(10000, size - start)
+        vectors = rng.random((count, EMBEDDING_VECTOR_SIZE), dtype=np.float32)
+        index.add_with_ids(vectors, np.arange(start, start + count))
+    faiss.write_index(index, path)
+
+
+def time_requests(get_index, query, requests):
+    timings = []
+    for _ in range(requests):
+        start_time = time.perf_counter()
+        get_index().search(query, 10)
+        timings.append(time.perf_counter() - start_time)
+    return np.array(timings) * 1000
+
+
+def report(label, timings):
+    mean, p95 = timings.mean(), np.percentile(timings, 95)
+    print(f"  {label}: mean {mean:.2f}ms p95 {p95:.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+
+    query = np.random.default_rng(1).random((1, EMBEDDING_VECTOR_SIZE), dtype=np.float32)
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "index.idx")
+            build_index_file(path, size)
+
+            # Old behaviour: deserialize the whole index on every request
+            reread = time_requests(lambda: faiss.read_index(path), query, args.requests)
+
+            # New behaviour: the first request loads, the rest reuse the index
+            manager = FaissIndexManager(FAISS_UNICON_PARTITION, path)
+            resident = time_requests(manager.get, query, args.requests)
+
+        print(f"{size} articles")
+        report("read_index per request", reread)
+        report("resident index manager", resident)
+        print(f"  (resident first request {resident[0]:.2f}ms)")
+
+
+if __name__ == "__main__":
+    main()
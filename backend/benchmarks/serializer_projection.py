@@ -0,0 +1,80 @@
+"""
+Compare the DRF response serializers against the values() projections on
+the same annotated querysets, reporting rows per second. Reads the articles,
+comments and notifications already in the configured database.
+
+    python benchmarks/serializer_projection.py --rows 100 --repeat 20
+"""
+import django_setup  # noqa: F401
+from community.utils import (
+    annotate_articles,
+    annotate_comments,
+    annotate_notifications,
+    project_articles,
+    project_comments,
+    project_notifications,
+)
+from community.utils.response_serializers import (
+    ArticleResponseSerializer,
+    CommentResponseSerializer,
+    NotificationResponseSerializer,
+)
+from community.models import Article, Comment, Notification
+import argparse
+import time
+
+
+def report(label, rows, repeat, elapsed):
+    print(
+        f"  {label}: {rows * repeat / elapsed:.0f} rows/s, "
+        f"{elapsed / repeat * 1000:.2f}ms per page"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    cases = [
+        (
+            "articles",
+            annotate_articles(Article.objects.all()),
+            project_articles,
+            ArticleResponseSerializer,
+        ),
+        (
+            "comments",
+            annotate_comments(Comment.objects.all()),
+            project_comments,
+            CommentResponseSerializer,
+        ),
+        (
+            "notifications",
+            annotate_notifications(Notification.objects.all()),
+            project_notifications,
+            NotificationResponseSerializer,
+        ),
+    ]
+    for name, queryset, project, serializer_class in cases:
+        queryset = queryset.order_by("-id")[: args.rows]
+        rows = queryset.count()
+        if not rows:
+            print(f"{name}: no rows, skipped")
+            continue
+        print(f"{name} ({rows} rows, query included):")
+
+        start_time = time.perf_counter()
+        for _ in range(args.repeat):
+            serializer_class(queryset.all(), many=True).data
+        report("serializer", rows, args.repeat, time.perf_counter() - start_time)
+
+        start_time = time.perf_counter()
+        for _ in range(args.repeat):
+            project(queryset.all())
+        report("projection", rows, args.repeat, time.perf_counter() - start_time)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import account.models
+import community.fields
+from django.db import migrations
+import numpy as np
+
+BATCH_SIZE = 1000
+
+
+def pack_embedding_vectors(apps, schema_editor):
+    User = apps.get_model("account", "User")
+    users = []
+    for user in User.objects.only("id", "embedding_vector").iterator(
+        chunk_size=BATCH_SIZE
+    ):
+        user.packed_embedding_vector = np.asarray(
+            user.embedding_vector, dtype=np.float32
+        )
+        users.append(user)
+        if len(users) == BATCH_SIZE:
+            User.objects.bulk_update(users, ["packed_embedding_vector"])
+            users = []
+    User.objects.bulk_update(users, ["packed_embedding_vector"])
+
+
+def unpack_embedding_vectors(apps, schema_editor):
+    User = apps.get_model("account", "User")
+    users = []
+    for user in User.objects.only("id", "packed_embedding_vector").iterator(
+        chunk_size=BATCH_SIZE
+    ):
+        user.embedding_vector = user.packed_embedding_vector.tolist()
+        users.append(user)
+        if len(users) == BATCH_SIZE:
+            User.objects.bulk_update(users, ["embedding_vector"])
+            users = []
+    User.objects.bulk_update(users, ["embedding_vector"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("account", "0002_school_email_identifier"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="packed_embedding_vector",
+            field=community.fields.VectorField(null=True),
+        ),
+        migrations.RunPython(pack_embedding_vectors, unpack_embedding_vectors),
+        migrations.RemoveField(
+            model_name="user",
+            name="embedding_vector",
+        ),
+        migrations.RenameField(
+            model_name="user",
+            old_name="packed_embedding_vector",
+            new_name="embedding_vector",
+        ),
+        migrations.AlterField(
+            model_name="user",
+            name="embedding_vector",
+            field=community.fields.VectorField(
+                default=account.models.default_embedding_vectors
+            ),
+        ),
+    ]
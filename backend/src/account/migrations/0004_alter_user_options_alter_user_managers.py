@@ -0,0 +1,26 @@
+import account.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("account", "0003_user_embedding_vector_binary"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="user",
+            options={
+                "base_manager_name": "objects",
+                "verbose_name": "user",
+                "verbose_name_plural": "users",
+            },
+        ),
+        migrations.AlterModelManagers(
+            name="user",
+            managers=[
+                ("objects", account.models.UserManager()),
+            ],
+        ),
+    ]
@@ -1,12 +1,13 @@
 from django.db import models
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager as AuthUserManager
 from django.utils import timezone
-import numpy as np
+from community.fields import VectorField, ZERO_EMBEDDING_VECTOR
 
 
 def default_embedding_vectors():
-    return np.zeros(1536).tolist()
+    # Shared read-only zero vector, the field packs it to bytes on save
+    return ZERO_EMBEDDING_VECTOR
 
 
 class School(models.Model):
@@ -16,6 +17,18 @@ class School(models.Model):
     email_identifier = models.CharField(max_length=10, default="unknown", null=False)
 
 
+class UserQuerySet(models.QuerySet):
+    def with_vector(self):
+        # Opt back in to loading the embedding vector
+        return self.defer(None)
+
+
+class UserManager(AuthUserManager.from_queryset(UserQuerySet)):
+    # The vector is only needed for the preference feed, so it is deferred
+    def get_queryset(self):
+        return super().get_queryset().defer("embedding_vector")
+
+
 class User(AbstractUser):
     email = models.CharField(max_length=254, default="unknown", null=False, unique=True)
     validation_code = models.CharField(max_length=6, default="000000", null=False)
@@ -25,7 +38,12 @@ class User(AbstractUser):
     is_superuser = models.BooleanField(default=False, null=False)
     date_joined = models.DateTimeField(default=timezone.now, null=False)
     school = models.ForeignKey(School, on_delete=models.CASCADE, null=True)
-    embedding_vector = models.JSONField(null=False, default=default_embedding_vectors)
+    embedding_vector = VectorField(null=False, default=default_embedding_vectors)
+
+    objects = UserManager()
+
+    class Meta(AbstractUser.Meta):
+        base_manager_name = "objects"
 
 
 class TimeTable(models.Model):
@@ -2,6 +2,8 @@ from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
 from .models import User
+from community.fields import ZERO_EMBEDDING_VECTOR
+import numpy as np
 from .constants import (
     LOGIN_NAME,
     REGISTER_NAME,
@@ -42,6 +44,16 @@ class AccountAppViewTest(APITestCase):
         self.assertEqual(user_instance.email, MOCK_USER["email"])
         self.assertFalse(user_instance.is_validated)
 
+    def test_user_default_embedding_vector(self):
+        # Validate a user can be created with the default zero vector
+        user_instance = User.objects.create(
+            email="default@vector.com", username="default"
+        )
+        user_instance = User.objects.with_vector().get(pk=user_instance.id)
+        self.assertTrue(
+            np.array_equal(user_instance.embedding_vector, ZERO_EMBEDDING_VECTOR)
+        )
+
     def test_register_with_used_email(self):
         response = request(self.client, REGISTER_NAME, MOCK_USER)
         response = request(self.client, REGISTER_NAME, MOCK_USER)
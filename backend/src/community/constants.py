@@ -2,8 +2,118 @@ CACHE_TIMEOUT = 60 * 60 * 24
 EMBEDDING_VECTOR_SIZE = 1536
 EMBEDDING_VECTOR_MODEL = "text-embedding-3-small"
 ENV_OPENAI_API_KEY = "OPENAI_API_KEY"
-INDEX_FILE_NAME = "index.idx"
+EMBEDDING_BATCH_SIZE = 256
+EMBEDDING_BATCH_WAIT = 0.01
+EMBEDDING_BATCH_TIMEOUT = 30
+QUERY_EMBEDDING_CACHE_KEY = (
+    lambda model, digest: f"QUERY_EMBEDDING_{model}_{digest}"
+)
+QUERY_EMBEDDING_STATS_CACHE_KEY = "QUERY_EMBEDDING_STATS"
+QUERY_EMBEDDING_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+QUERY_EMBEDDING_LRU_SIZE = 1024
+QUERY_EMBEDDING_STATS_FLUSH_SIZE = 100
+SEARCH_CONFIG = "simple"
+SEARCH_MODES = ["hybrid", "vector", "lexical"]
+SEARCH_KEYWORD_MAX_TERMS = 2
+SEARCH_RRF_K = 60
+FAISS_UNICON_PARTITION = "unicon"
+FAISS_SCHOOL_PARTITION = (
+    lambda school_id: f"school_{school_id}"
+)
+INDEX_FILE_NAME = (
+    lambda partition: f"index_{partition}.idx"
+)
+FAISS_DELTA_CACHE_KEY = (
+    lambda partition: f"FAISS_DELTA_{partition}"
+)
+FAISS_CHECKPOINT_LOCK_CACHE_KEY = "FAISS_CHECKPOINT_LOCK"
+FAISS_CHECKPOINT_INTERVAL = 60
+FAISS_CHECKPOINT_LOCK_TIMEOUT = 60 * 30
+FAISS_BUILD_BATCH_SIZE = 1000
+FAISS_HNSW_M = 32
+FAISS_HNSW_EF_CONSTRUCTION = 80
+FAISS_HNSW_EF_SEARCH = 64
+FAISS_IVF_NLIST = (
+    lambda size: max(1, min(4096, size // 39))
+)
+FAISS_IVF_NPROBE = 16
+FAISS_PQ_M = 64
+FAISS_TRAINING_MIN_SIZE = 10000
+FAISS_TRAINING_SAMPLE_SIZE = 100000
+FAISS_INDEX_FACTORIES = {
+    "flat": lambda size: "IDMap,Flat",
+    "hnsw": lambda size: f"IDMap,HNSW{FAISS_HNSW_M},Flat",
+    "ivfpq": lambda size: f"IDMap,IVF{FAISS_IVF_NLIST(size)},PQ{FAISS_PQ_M}",
+}
+PREFERENCE_ALPHA = 0.1
+PREFERENCE_EVENTS_CACHE_KEY = "PREFERENCE_EVENTS"
+PREFERENCE_FOLD_LOCK_CACHE_KEY = "PREFERENCE_FOLD_LOCK"
+PREFERENCE_FOLD_INTERVAL = 30
+PREFERENCE_FOLD_LOCK_TIMEOUT = 60 * 5
+PREFERENCE_FOLD_BATCH_SIZE = 10000
+PREFERENCE_DIRTY_USERS_CACHE_KEY = "PREFERENCE_DIRTY_USERS"
+PREFERENCE_NEW_ARTICLES_CACHE_KEY = "PREFERENCE_NEW_ARTICLES"
+PREFERENCE_ACTIVE_USERS_CACHE_KEY = "PREFERENCE_ACTIVE_USERS"
+PREFERENCE_ACTIVE_WINDOW = 60 * 60 * 24 * 7
+PREFERENCE_FEED_CACHE_KEY = (
+    lambda user_id: f"PREFERENCE_FEED_{user_id}"
+)
+PREFERENCE_FEED_SIZE = 1000
+PREFERENCE_FEED_MAX_AGE = 60 * 10
+PREFERENCE_MATERIALIZE_LOCK_CACHE_KEY = "PREFERENCE_MATERIALIZE_LOCK"
+PREFERENCE_MATERIALIZE_INTERVAL = 60
+PREFERENCE_MATERIALIZE_LOCK_TIMEOUT = 60 * 10
+ARTICLE_COUNTERS_CACHE_KEY = (
+    lambda article_id: f"ARTICLE_{article_id}_COUNTERS"
+)
+COMMENT_COUNTERS_CACHE_KEY = (
+    lambda comment_id: f"COMMENT_{comment_id}_COUNTERS"
+)
+ARTICLE_FLUSHED_COUNTS_CACHE_KEY = (
+    lambda article_id: f"ARTICLE_{article_id}_FLUSHED_COUNTS"
+)
+COMMENT_FLUSHED_COUNTS_CACHE_KEY = (
+    lambda comment_id: f"COMMENT_{comment_id}_FLUSHED_COUNTS"
+)
+FLUSHED_COUNTS_TIMEOUT = CACHE_TIMEOUT + 60 * 60
+ARTICLE_COUNTERS_DIRTY_CACHE_KEY = "ARTICLE_COUNTERS_DIRTY"
+ARTICLE_COUNTER_FIELDS = ["views_count", "comments_count", "likes_count"]
+ARTICLE_STATUS_FIELDS = ["like_status", "view_status", "save_status"]
+COMMENT_COUNTERS_DIRTY_CACHE_KEY = "COMMENT_COUNTERS_DIRTY"
+COUNTER_FLUSH_LOCK_CACHE_KEY = "COUNTER_FLUSH_LOCK"
+COUNTER_FLUSH_INTERVAL = 10
+COUNTER_FLUSH_LOCK_TIMEOUT = 60 * 5
+COUNTER_FLUSH_BATCH_SIZE = 500
+ARTICLE_VIEWERS_CACHE_KEY = (
+    lambda article_id: f"ARTICLE_{article_id}_VIEWERS"
+)
+ARTICLE_VIEWS_PENDING_CACHE_KEY = "ARTICLE_VIEWS_PENDING"
+ARTICLE_VIEWS_FLUSH_LOCK_CACHE_KEY = "ARTICLE_VIEWS_FLUSH_LOCK"
+ARTICLE_VIEWS_FLUSH_INTERVAL = 10
+ARTICLE_VIEWS_FLUSH_LOCK_TIMEOUT = 60 * 5
+ARTICLE_VIEWS_FLUSH_BATCH_SIZE = 10000
+HOT_ARTICLES_CACHE_KEY = (
+    lambda school_id: f"HOT_ARTICLES_{school_id}"
+)
+HOT_ARTICLES_BUILT_MEMBER = "BUILT"
+HOT_DECAY_LOCK_CACHE_KEY = "HOT_DECAY_LOCK"
+HOT_DECAY_INTERVAL = 60 * 5
+HOT_DECAY_LOCK_TIMEOUT = 60 * 15
+HOT_GRAVITY = 1.8
+HOT_WINDOW = 60 * 60 * 24 * 30
+CACHE_REBUILD_LOCK_CACHE_KEY = (
+    lambda cache_key: f"{cache_key}_REBUILD_LOCK"
+)
+CACHE_REBUILD_LOCK_TIMEOUT = 30
+CACHE_REBUILD_WAIT = 2
+CACHE_REBUILD_POLL_INTERVAL = 0.05
+CACHE_EARLY_REFRESH_DELTA = 1
+CACHE_EARLY_REFRESH_BETA = 1.0
+CACHE_INVALIDATION_CHANNEL = "CACHE_INVALIDATION"
+CACHE_LOCAL_SIZE = 5000
+CACHE_LOCAL_TIMEOUT = 60
 PAGINATOR_SIZE = 10
+RANKED_ARTICLES_WINDOW_SIZE = 200
 NOTIFICATION_EMAIL_SUBJECT = "You have a new notification from UNI.CON"
 NOTIFICATION_EMAIL_BODY = (
     lambda type_name, content, group: f"You have a new {group} on {type_name}: {content}"
@@ -24,6 +134,9 @@ EMAIL_NOTIFICATIONS_THRESHOLD = 5
 ARTICLE_CACHE_KEY = (
     lambda article_id: f"ARTICLE_{article_id}"
 )
+ARTICLE_JSON_CACHE_KEY = (
+    lambda article_id: f"ARTICLE_{article_id}_JSON"
+)
 ARTICLES_CACHE_KEY = (
     lambda school_id, view_name, identifier="": f"SCHOOL_{school_id}_VIEW_{view_name}_IDF_{identifier}"
 )
@@ -57,6 +170,7 @@ ARTICLE_PATCH_DETAIL_DELETE_NAME = "article-detail"
 ARTICLE_LIST_CREATE_NAME = "article-list"
 ARTICLE_SCORE_NAME = "article-hot"
 ARTICLE_PREFERENCE_NAME = "article-preference"
+ARTICLE_SEARCH_NAME = "article-search"
 ARTICLE_LIKE_NAME = "article-like"
 ARTICLE_UNLIKE_NAME = "article-unlike"
 
@@ -0,0 +1,41 @@
+from community.constants import EMBEDDING_VECTOR_SIZE
+from django.db import models
+import numpy as np
+
+
+class VectorField(models.BinaryField):
+    """
+    Stores an embedding vector as packed float32 bytes and loads it as a
+    read-only numpy array that shares the buffer of the fetched value.
+    """
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return np.frombuffer(value, dtype=np.float32)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, np.ndarray):
+            return value
+
+        # BinaryField decodes the base64 text used by fixtures and dumpdata
+        if isinstance(value, str):
+            value = super().to_python(value)
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return np.frombuffer(value, dtype=np.float32)
+        return np.asarray(value, dtype=np.float32)
+
+    def get_default(self):
+        # BinaryField compares the default with "", which an array cannot answer
+        if self.has_default():
+            return self.to_python(models.Field.get_default(self))
+        return super().get_default()
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, (bytes, bytearray, memoryview)):
+            return value
+        return np.asarray(value, dtype=np.float32).tobytes()
+
+
+ZERO_EMBEDDING_VECTOR = np.zeros(EMBEDDING_VECTOR_SIZE, dtype=np.float32)
+ZERO_EMBEDDING_VECTOR.flags.writeable = False
@@ -0,0 +1,53 @@
+from community.constants import EMBEDDING_BATCH_SIZE
+from community.utils.embedding_utils import (
+    get_embeddings,
+    add_embedding_to_faiss,
+    get_faiss_partition,
+)
+from django.core.management.base import BaseCommand
+from django.core.management import call_command
+from community.models import Article
+
+
+class Command(BaseCommand):
+    help = "Embed articles in batches, by default only the ones without a vector."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Re-embed every article and rebuild the FAISS indexes afterwards.",
+        )
+        parser.add_argument("--batch-size", type=int, default=EMBEDDING_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        queryset = Article.objects.select_related("user").order_by("id")
+        if not options["all"]:
+            queryset = queryset.filter(embedding_vector__isnull=True)
+
+        total, calls = 0, 0
+        articles = list(queryset)
+        for start in range(0, len(articles), options["batch_size"]):
+            batch = articles[start : start + options["batch_size"]]  # noqa: E203
+
+            # One backend call per batch instead of one per article
+            vectors = get_embeddings([article.title + article.body for article in batch])
+            for article, vector in zip(batch, vectors):
+                article.embedding_vector = vector
+            Article.objects.bulk_update(batch, ["embedding_vector"])
+            calls += 1
+            total += len(batch)
+
+            if not options["all"]:
+                for article in batch:
+                    add_embedding_to_faiss(
+                        article.embedding_vector,
+                        article.id,
+                        get_faiss_partition(article.unicon, article.user.school_id),
+                    )
+
+        self.stdout.write(f"Embedded {total} articles in {calls} batches.")
+
+        # Existing vectors changed, the indexes have to be rebuilt from scratch
+        if options["all"] and total:
+            call_command("rebuild_faiss_index", stdout=self.stdout)
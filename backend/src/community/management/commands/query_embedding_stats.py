@@ -0,0 +1,13 @@
+from community.utils.embedding_utils import get_query_embedding_stats
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Report the hit rate of the search query embedding cache."
+
+    def handle(self, *args, **options):
+        stats = get_query_embedding_stats()
+        self.stdout.write(
+            f"local hits: {stats['local_hits']}, redis hits: {stats['redis_hits']}, "
+            f"misses: {stats['misses']}, hit rate: {stats['hit_rate']:.1%}"
+        )
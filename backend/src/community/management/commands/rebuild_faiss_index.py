@@ -0,0 +1,127 @@
+from community.constants import (
+    FAISS_DELTA_CACHE_KEY,
+    FAISS_INDEX_FACTORIES,
+    FAISS_CHECKPOINT_LOCK_CACHE_KEY,
+    FAISS_CHECKPOINT_LOCK_TIMEOUT,
+)
+from community.utils.embedding_utils import (
+    get_faiss_index_manager,
+    get_all_faiss_partitions,
+    load_article_vectors,
+    build_faiss_index,
+    trim_faiss_delta,
+)
+from community.utils.cache_utils import hold_lock
+from django.core.management.base import BaseCommand, CommandError
+from django_redis import get_redis_connection
+from django.conf import settings
+import numpy as np
+import faiss
+import time
+
+
+class Command(BaseCommand):
+    help = "Train and rebuild the FAISS index from the stored article embeddings."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--type",
+            choices=list(FAISS_INDEX_FACTORIES.keys()),
+            help="Index type to build, defaults to the FAISS_INDEX_TYPE setting.",
+        )
+        parser.add_argument(
+            "--partition",
+            action="append",
+            help="Partition to rebuild (e.g. unicon, school_1), defaults to all.",
+        )
+        parser.add_argument(
+            "--report",
+            action="store_true",
+            help="Report recall and query latency against exact search.",
+        )
+        parser.add_argument("--queries", type=int, default=100)
+        parser.add_argument("--k", type=int, default=10)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Build (and report) without replacing the live index.",
+        )
+
+    def handle(self, *args, **options):
+        index_type = options["type"] or settings.FAISS_INDEX_TYPE
+        for partition in options["partition"] or get_all_faiss_partitions():
+            if options["dry_run"]:
+                self.rebuild(partition, index_type, options)
+                continue
+
+            # A checkpoint meanwhile would trim the delta log and write the old index
+            with hold_lock(
+                FAISS_CHECKPOINT_LOCK_CACHE_KEY,
+                FAISS_CHECKPOINT_LOCK_TIMEOUT,
+                blocking_timeout=FAISS_CHECKPOINT_LOCK_TIMEOUT,
+            ) as locked:
+                if not locked:
+                    raise CommandError("The FAISS checkpoint is still running.")
+                self.rebuild(partition, index_type, options)
+
+    def rebuild(self, partition, index_type, options):
+        redis_connection = get_redis_connection("default")
+
+        # Every delta entry queued so far is covered by the vectors loaded below
+        entries = redis_connection.lrange(FAISS_DELTA_CACHE_KEY(partition), 0, -1)
+        ids, vectors = load_article_vectors(partition)
+
+        start_time = time.perf_counter()
+        index = build_faiss_index(ids, vectors, index_type)
+        self.stdout.write(
+            f"Built {index_type} index for {partition} with {index.ntotal} vectors "
+            f"in {time.perf_counter() - start_time:.1f}s"
+        )
+
+        if options["report"] and len(ids):
+            self.report(index, ids, vectors, options["queries"], options["k"])
+
+        if options["dry_run"]:
+            return
+
+        get_faiss_index_manager(partition).write(index)
+        if entries:
+            trim_faiss_delta(partition, entries)
+        self.stdout.write(self.style.SUCCESS(f"The {partition} index has been replaced."))
+
+    def report(self, index, ids, vectors, queries, k):
+        exact_index = faiss.IndexIDMap(faiss.IndexFlatL2(vectors.shape[1]))
+        exact_index.add_with_ids(vectors, ids)
+
+        # Query with stored article vectors, one at a time like the feed does
+        sample = np.random.default_rng(0).choice(
+            len(vectors), min(queries, len(vectors)), replace=False
+        )
+        recalls, exact_timings, timings = [], [], []
+        for position in sample:
+            query = vectors[position : position + 1]  # noqa: E203
+
+            start_time = time.perf_counter()
+            _, exact_ids = exact_index.search(query, k)
+            exact_timings.append(time.perf_counter() - start_time)
+
+            start_time = time.perf_counter()
+            _, found_ids = index.search(query, k)
+            timings.append(time.perf_counter() - start_time)
+
+            expected = set(exact_ids[0][exact_ids[0] != -1])
+            recalls.append(len(expected & set(found_ids[0])) / max(1, len(expected)))
+
+        exact_timings = np.array(exact_timings) * 1000
+        timings = np.array(timings) * 1000
+        self.stdout.write(
+            f"recall@{k}: {np.mean(recalls):.3f} over {len(sample)} queries"
+        )
+        self.stdout.write(
+            f"exact latency: mean {exact_timings.mean():.2f}ms "
+            f"p95 {np.percentile(exact_timings, 95):.2f}ms"
+        )
+        self.stdout.write(
+            f"index latency: mean {timings.mean():.2f}ms "
+            f"p95 {np.percentile(timings, 95):.2f}ms"
+        )
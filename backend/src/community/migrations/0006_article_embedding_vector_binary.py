@@ -0,0 +1,65 @@
+import community.fields
+from django.db import migrations
+import numpy as np
+
+BATCH_SIZE = 1000
+
+
+def pack_embedding_vectors(apps, schema_editor):
+    Article = apps.get_model("community", "Article")
+    articles = []
+    for article in Article.objects.only("id", "embedding_vector").iterator(
+        chunk_size=BATCH_SIZE
+    ):
+        article.packed_embedding_vector = np.asarray(
+            article.embedding_vector, dtype=np.float32
+        )
+        articles.append(article)
+        if len(articles) == BATCH_SIZE:
+            Article.objects.bulk_update(articles, ["packed_embedding_vector"])
+            articles = []
+    Article.objects.bulk_update(articles, ["packed_embedding_vector"])
+
+
+def unpack_embedding_vectors(apps, schema_editor):
+    Article = apps.get_model("community", "Article")
+    articles = []
+    for article in Article.objects.only("id", "packed_embedding_vector").iterator(
+        chunk_size=BATCH_SIZE
+    ):
+        article.embedding_vector = article.packed_embedding_vector.tolist()
+        articles.append(article)
+        if len(articles) == BATCH_SIZE:
+            Article.objects.bulk_update(articles, ["embedding_vector"])
+            articles = []
+    Article.objects.bulk_update(articles, ["embedding_vector"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("community", "0005_notification_email"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="article",
+            name="packed_embedding_vector",
+            field=community.fields.VectorField(null=True),
+        ),
+        migrations.RunPython(pack_embedding_vectors, unpack_embedding_vectors),
+        migrations.RemoveField(
+            model_name="article",
+            name="embedding_vector",
+        ),
+        migrations.RenameField(
+            model_name="article",
+            old_name="packed_embedding_vector",
+            new_name="embedding_vector",
+        ),
+        migrations.AlterField(
+            model_name="article",
+            name="embedding_vector",
+            field=community.fields.VectorField(blank=True),
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("community", "0006_article_embedding_vector_binary"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="article",
+            options={"base_manager_name": "objects", "ordering": ["-created_at"]},
+        ),
+    ]
@@ -0,0 +1,17 @@
+import community.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("community", "0007_alter_article_options"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="article",
+            name="embedding_vector",
+            field=community.fields.VectorField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,50 @@
+import django.contrib.postgres.search
+from django.db import migrations
+
+INDEX_NAME = "community_article_search_vector_gin"
+
+
+def create_search_index(apps, schema_editor):
+    # tsvector and GIN only exist on Postgres, tests run on sqlite
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    schema_editor.execute(
+        f"CREATE INDEX {INDEX_NAME} ON community_article USING gin (search_vector)"
+    )
+    schema_editor.execute(
+        """
+        UPDATE community_article AS article SET search_vector =
+            setweight(to_tsvector('simple', article.title), 'A')
+            || setweight(to_tsvector('simple', coalesce((
+                SELECT string_agg(course.code, ' ')
+                FROM community_articlecourse AS article_course
+                JOIN community_course AS course ON course.id = article_course.course_id
+                WHERE article_course.article_id = article.id
+            ), '')), 'A')
+            || setweight(to_tsvector('simple', article.body), 'B')
+        """
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    schema_editor.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("community", "0008_alter_article_embedding_vector"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="article",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
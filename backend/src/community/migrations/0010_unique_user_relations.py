@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+# (model name, related field) pairs that get a unique (user, related) constraint
+USER_RELATIONS = [
+    ("ArticleView", "article"),
+    ("ArticleLike", "article"),
+    ("ArticleSave", "article"),
+    ("CommentLike", "comment"),
+]
+
+
+def get_relation_counters():
+    # (related model name, counter) that every row of the relation incremented
+    counters = {
+        "ArticleLike": ("Article", "likes_count"),
+        "CommentLike": ("Comment", "likes_count"),
+    }
+    if settings.UNIQUE_ARTICLE_VIEWS:
+        counters["ArticleView"] = ("Article", "views_count")
+    return counters
+
+
+def delete_duplicate_relations(apps, schema_editor):
+    counters = get_relation_counters()
+
+    # Keep the oldest row of every (user, related) pair
+    for model_name, field in USER_RELATIONS:
+        model = apps.get_model("community", model_name)
+        kept_ids = (
+            model.objects.values("user", field)
+            .annotate(kept_id=Min("id"))
+            .values_list("kept_id", flat=True)
+        )
+        duplicates = model.objects.exclude(id__in=list(kept_ids))
+
+        # Take the increments of the deleted rows back out of the counts
+        if model_name in counters:
+            related_model_name, counter = counters[model_name]
+            related_model = apps.get_model("community", related_model_name)
+            duplicate_counts = (
+                duplicates.values(field)
+                .annotate(duplicate_count=Count("id"))
+                .values_list(field, "duplicate_count")
+            )
+            for related_id, duplicate_count in duplicate_counts:
+                related_model.objects.filter(pk=related_id).update(
+                    **{counter: F(counter) - duplicate_count}
+                )
+        duplicates.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("community", "0009_article_search_vector"),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_relations, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="articleview",
+            constraint=models.UniqueConstraint(
+                fields=("user", "article"), name="unique_article_view"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="articlelike",
+            constraint=models.UniqueConstraint(
+                fields=("user", "article"), name="unique_article_like"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="articlesave",
+            constraint=models.UniqueConstraint(
+                fields=("user", "article"), name="unique_article_save"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="commentlike",
+            constraint=models.UniqueConstraint(
+                fields=("user", "comment"), name="unique_comment_like"
+            ),
+        ),
+    ]
@@ -3,6 +3,20 @@ from django.db import models
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from community.constants import NOTIFICATION_GROUP
+from django.contrib.postgres.search import SearchVectorField
+from community.fields import VectorField
+
+class ArticleQuerySet(models.QuerySet):
+    def with_vector(self):
+        # Opt back in to loading the embedding vector
+        return self.defer(None)
+
+
+class ArticleManager(models.Manager.from_queryset(ArticleQuerySet)):
+    # The vectors are only needed for FAISS, preferences and search filters
+    def get_queryset(self):
+        return super().get_queryset().defer("embedding_vector", "search_vector")
+
 
 class Article(models.Model):
     title = models.CharField(max_length=100, default="unknown", null=False)
@@ -18,11 +32,19 @@ class Article(models.Model):
     comments_count = models.IntegerField(default=0, null=False)
     likes_count = models.IntegerField(default=0, null=False)
 
-    embedding_vector = models.JSONField(null=False, blank=True)
+    embedding_vector = VectorField(null=True, blank=True)
+    search_vector = SearchVectorField(null=True, blank=True)
     engagement_score = models.FloatField(default=0, null=False)
 
+    objects = ArticleManager()
+
     class Meta:
         ordering = ["-created_at"]
+        base_manager_name = "objects"
+        indexes = [
+            # Keyset pagination seeks on (created_at, id)
+            models.Index(fields=["-created_at", "-id"], name="article_created_at_id_idx"),
+        ]
 
 
 class ArticleUser(models.Model):
@@ -39,6 +61,13 @@ class ArticleLike(models.Model):
     article = models.ForeignKey(Article, on_delete=models.CASCADE, null=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=False)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "article"], name="unique_article_like"
+            )
+        ]
+
 
 class Course(models.Model):
     code = models.CharField(max_length=100, default="unknown", null=False)
@@ -54,11 +83,25 @@ class ArticleView(models.Model):
     article = models.ForeignKey(Article, on_delete=models.CASCADE, null=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=False)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "article"], name="unique_article_view"
+            )
+        ]
+
 
 class ArticleSave(models.Model):
     article = models.ForeignKey(Article, on_delete=models.CASCADE, null=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=False)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "article"], name="unique_article_save"
+            )
+        ]
+
 
 class Comment(models.Model):
     body = models.TextField(default="unknown", null=False)
@@ -82,6 +125,13 @@ class CommentLike(models.Model):
     comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=False)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "comment"], name="unique_comment_like"
+            )
+        ]
+
 class Notification(models.Model):
     group = models.IntegerField(choices=NOTIFICATION_GROUP, default=0)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=False)
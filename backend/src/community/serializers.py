@@ -1,5 +1,4 @@
 from community.models import Article, Comment
-from community.utils import get_embedding
 from rest_framework import serializers
 from django.db import transaction
 
@@ -64,12 +63,7 @@ class ArticleSerializer(serializers.ModelSerializer):
 
         del validated_data["course_code"]
 
-        # Calculate and save the embedding vector
-        validated_data["embedding_vector"] = get_embedding(
-            validated_data["title"] + validated_data["body"]
-        )
-
-        # Save the new article
+        # Save the new article, the embedding vector is filled in by a task
         with transaction.atomic():
             article_instance = Article.objects.create(**validated_data)
 
@@ -2,8 +2,21 @@ from celery import shared_task
 from community.constants import (
     NOTIFICATION_EMAIL_BODY,
     NOTIFICATION_EMAIL_SUBJECT,
-    NOTIFICATION_GROUP_KV
+    NOTIFICATION_GROUP_KV,
+    FAISS_CHECKPOINT_LOCK_CACHE_KEY,
+    FAISS_CHECKPOINT_LOCK_TIMEOUT,
+    PREFERENCE_FOLD_LOCK_CACHE_KEY,
+    PREFERENCE_FOLD_LOCK_TIMEOUT,
+    PREFERENCE_MATERIALIZE_LOCK_CACHE_KEY,
+    PREFERENCE_MATERIALIZE_LOCK_TIMEOUT,
+    HOT_DECAY_LOCK_CACHE_KEY,
+    HOT_DECAY_LOCK_TIMEOUT,
+    COUNTER_FLUSH_LOCK_CACHE_KEY,
+    COUNTER_FLUSH_LOCK_TIMEOUT,
+    ARTICLE_VIEWS_FLUSH_LOCK_CACHE_KEY,
+    ARTICLE_VIEWS_FLUSH_LOCK_TIMEOUT,
 )
+from community.models import Article
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from decouple import config
@@ -35,3 +48,108 @@ def send_email(contents, email):
         
     except Exception as e:
         print("Error:", e)
+
+
+@shared_task(bind=True, max_retries=5, default_retry_delay=10)
+def embed_article(self, article_id):
+    from community.utils import (
+        get_embedding,
+        add_embedding_to_faiss,
+        get_faiss_partition,
+        mark_new_preference_articles,
+    )
+
+    article_instance = Article.objects.select_related("user").get(pk=article_id)
+    try:
+        embedding_vector = get_embedding(article_instance.title + article_instance.body)
+    except Exception as e:
+        raise self.retry(exc=e)
+
+    # Fill the vector, the article joins preference and search from now on
+    Article.objects.filter(pk=article_id).update(embedding_vector=embedding_vector)
+    add_embedding_to_faiss(
+        embedding_vector,
+        article_id,
+        get_faiss_partition(article_instance.unicon, article_instance.user.school_id),
+    )
+    mark_new_preference_articles()
+
+
+@shared_task
+def checkpoint_faiss_index():
+    from community.utils import checkpoint_faiss_index as checkpoint
+    from community.utils import get_all_faiss_partitions, hold_lock
+
+    # Skip if the previous checkpoint is still running, a slow one outlives the interval
+    with hold_lock(
+        FAISS_CHECKPOINT_LOCK_CACHE_KEY, FAISS_CHECKPOINT_LOCK_TIMEOUT
+    ) as locked:
+        if not locked:
+            return 0
+        return sum(checkpoint(partition) for partition in get_all_faiss_partitions())
+
+
+@shared_task
+def fold_preference_events():
+    from community.utils import fold_preference_events as fold
+    from community.utils import hold_lock
+
+    # Skip if the previous fold is still running
+    with hold_lock(
+        PREFERENCE_FOLD_LOCK_CACHE_KEY, PREFERENCE_FOLD_LOCK_TIMEOUT
+    ) as locked:
+        if not locked:
+            return 0
+        return fold()
+
+
+@shared_task
+def refresh_preference_feeds():
+    from community.utils import refresh_preference_feeds as refresh
+    from community.utils import hold_lock
+
+    # Skip if the previous refresh is still running
+    with hold_lock(
+        PREFERENCE_MATERIALIZE_LOCK_CACHE_KEY, PREFERENCE_MATERIALIZE_LOCK_TIMEOUT
+    ) as locked:
+        if not locked:
+            return 0
+        return refresh()
+
+
+@shared_task
+def decay_hot_rankings():
+    from community.utils import rebuild_hot_rankings
+    from community.utils import hold_lock
+
+    # Skip if the previous decay is still running
+    with hold_lock(HOT_DECAY_LOCK_CACHE_KEY, HOT_DECAY_LOCK_TIMEOUT) as locked:
+        if not locked:
+            return 0
+        return rebuild_hot_rankings()
+
+
+@shared_task
+def flush_counters():
+    from community.utils import flush_counters as flush
+    from community.utils import hold_lock
+
+    # Skip if the previous flush is still running, a slow flush outlives the interval
+    with hold_lock(COUNTER_FLUSH_LOCK_CACHE_KEY, COUNTER_FLUSH_LOCK_TIMEOUT) as locked:
+        if not locked:
+            return 0
+        return flush()
+
+
+@shared_task
+def flush_article_views():
+    from community.utils import flush_article_views as flush
+    from community.utils import hold_lock
+
+    # Skip if the previous flush is still running
+    with hold_lock(
+        ARTICLE_VIEWS_FLUSH_LOCK_CACHE_KEY, ARTICLE_VIEWS_FLUSH_LOCK_TIMEOUT
+    ) as locked:
+        if not locked:
+            return 0
+        return flush()
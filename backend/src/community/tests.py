@@ -3,20 +3,58 @@ from .models import (
     Course,
     ArticleCourse,
     ArticleLike,
+    ArticleView,
     Comment,
     CommentLike,
+    Notification,
     User,
 )
 from rest_framework.test import APITestCase, APIClient
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command, CommandError
+from django.core.exceptions import ImproperlyConfigured
+from django.test import override_settings
 from django.core.cache import cache
+from django_redis import get_redis_connection
+from django_redis.exceptions import CompressorError
+from django.db import connection, transaction, IntegrityError
 from rest_framework import status
 from django.urls import reverse
-from datetime import datetime
+from datetime import datetime, timedelta
+from django.utils import timezone
+from unittest.mock import patch
 from copy import deepcopy
+from io import StringIO
 import numpy as np
+import faiss
+import threading
+import time
 
 # import json
-from community.utils import reset_faiss, get_faiss_index
+from community.utils import reset_faiss, get_faiss_index, checkpoint_faiss_index
+from community.utils import get_visible_faiss_partitions, get_all_faiss_partitions
+from community.utils import search_similar_embeddings
+from community.utils import get_embedding, get_embeddings
+from community.utils import fold_preference_events, update_preference_vector
+from community.utils import refresh_preference_feeds, rebuild_hot_rankings
+from community.utils import flush_counters, flush_article_views
+from community.utils.database_utils import update_articles_engagement_score
+from community.utils import get_query_embedding, get_query_embedding_stats
+from community.utils import get_or_rebuild, get_many_or_rebuild
+from community.utils import invalidate_cache, clear_local_cache, hold_lock
+from community.utils import annotate_articles, annotate_comments, annotate_notifications
+from community.utils import project_articles, project_comments, project_notifications
+from community.utils import ARTICLE_AGGREGATES
+from community.utils.embedding_utils import get_faiss_delta, trim_faiss_delta
+from community.utils.embedding_backends import get_embedding_batcher
+from community.utils.embedding_backends import EmbeddingBatcher, LocalEmbeddingBackend
+from community.utils.response_serializers import (
+    ArticleResponseSerializer,
+    CommentResponseSerializer,
+    NotificationResponseSerializer,
+)
+from django.contrib.contenttypes.models import ContentType
+from src.cache_serializers import MsgPackSerializer, ZstdCompressor, ZSTD_MAGIC
 from .constants import (
     REGISTER_SUBMIT_NAME,
     REGISTER_CONFIRM_VIEW_NAME,
@@ -24,6 +62,12 @@ from .constants import (
     ARTICLE_LIST_CREATE_NAME,
     ARTICLE_SCORE_NAME,
     ARTICLE_PREFERENCE_NAME,
+    ARTICLE_SEARCH_NAME,
+    PAGINATOR_SIZE,
+    CACHE_REBUILD_LOCK_CACHE_KEY,
+    CACHE_TIMEOUT,
+    ARTICLE_JSON_CACHE_KEY,
+    ARTICLE_VIEWERS_CACHE_KEY,
     ARTICLE_LIKE_NAME,
     ARTICLE_UNLIKE_NAME,
     COMMENT_PATCH_DETAIL_DELETE_NAME,
@@ -38,6 +82,12 @@ from .constants import (
     MOCK_USER_1,
     MOCK_USER_2,
     MOCK_USER_3,
+    FAISS_UNICON_PARTITION,
+    FAISS_SCHOOL_PARTITION,
+    FAISS_DELTA_CACHE_KEY,
+    FAISS_CHECKPOINT_LOCK_CACHE_KEY,
+    EMBEDDING_VECTOR_SIZE,
+    HOT_WINDOW,
 )
 
 
@@ -97,6 +147,7 @@ class articleModificationTests(APITestCase):
 
     def setUp(self):
         cache.clear()
+        clear_local_cache()
         self.client = APIClient()
 
     def test_post_article(self):
@@ -333,9 +384,98 @@ class articleModificationTests(APITestCase):
             article=article_instance, user=user_instance
         ).exists()
         self.assertTrue(article_like_exist)
+        flush_counters()
         article_instance = Article.objects.get(pk=article_instance.id)
         self.assertEqual(article_instance.likes_count, 1)
 
+    def test_failed_counter_flush_is_retried(self):
+
+        register_account(self.client, MOCK_USER_1)
+        article_instance = article(self.client, "post", MOCK_ARTICLE)
+        self.client.post(reverse(ARTICLE_LIKE_NAME, kwargs={"pk": article_instance.id}))
+
+        # The article stays dirty when the update fails, the next flush applies it
+        with patch(
+            "community.utils.counter_utils.apply_counter_deltas",
+            side_effect=IntegrityError,
+        ):
+            with self.assertRaises(IntegrityError):
+                flush_counters()
+        self.assertEqual(Article.objects.get(pk=article_instance.id).likes_count, 0)
+        self.assertEqual(flush_counters(), 1)
+        self.assertEqual(Article.objects.get(pk=article_instance.id).likes_count, 1)
+        self.assertEqual(flush_counters(), 0)
+
+    def test_counter_flush_failing_after_the_update_is_not_reapplied(self):
+
+        register_account(self.client, MOCK_USER_1)
+        article_instance = article(self.client, "post", MOCK_ARTICLE)
+        self.client.post(reverse(ARTICLE_LIKE_NAME, kwargs={"pk": article_instance.id}))
+
+        # The deltas are released once committed, the next flush has nothing left
+        with patch(
+            "community.utils.counter_utils.update_hot_scores",
+            side_effect=RuntimeError,
+        ):
+            with self.assertRaises(RuntimeError):
+                flush_counters()
+        self.assertEqual(flush_counters(), 0)
+        self.assertEqual(Article.objects.get(pk=article_instance.id).likes_count, 1)
+
+    def test_counter_flush_reads_the_schools_once(self):
+
+        register_account(self.client, MOCK_USER_1)
+        for _ in range(3):
+            article_instance = article(self.client, "post", MOCK_ARTICLE)
+            self.client.post(reverse(ARTICLE_LIKE_NAME, kwargs={"pk": article_instance.id}))
+        rebuild_hot_rankings()
+
+        # Every UNI.CON article is fanned out to the schools of one query
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(flush_counters(), 3)
+        school_queries = [
+            query
+            for query in queries.captured_queries
+            if 'FROM "account_school"' in query["sql"]
+        ]
+        self.assertEqual(len(school_queries), 1)
+
+    def test_counts_stay_exact_across_a_flush(self):
+
+        register_account(self.client, MOCK_USER_1)
+        article_id = article(self.client, "post", MOCK_ARTICLE).id
+        retrieve_articles_url = reverse(ARTICLE_LIST_CREATE_NAME)
+        self.client.post(reverse(ARTICLE_LIKE_NAME, kwargs={"pk": article_id}))
+
+        def get_likes_count():
+            response = self.client.get(retrieve_articles_url)
+            return response.data["results"]["articles"][0]["likes_count"]
+
+        self.assertEqual(get_likes_count(), 1)
+        stale_encoded_article = cache.get(ARTICLE_JSON_CACHE_KEY(article_id))
+
+        # Read the feed after the update is applied but before the deltas are released
+        counts_during_flush = []
+
+        def update_and_read(article_ids):
+            update_articles_engagement_score(article_ids)
+            counts_during_flush.append(get_likes_count())
+
+        with patch(
+            "community.utils.counter_utils.update_articles_engagement_score",
+            side_effect=update_and_read,
+        ):
+            self.assertEqual(flush_counters(), 1)
+        self.assertEqual(counts_during_flush, [1])
+        self.assertEqual(Article.objects.get(pk=article_id).likes_count, 1)
+        self.assertEqual(get_likes_count(), 1)
+
+        # A rebuild that read the counts before the flush cannot bring them back
+        cache.set(ARTICLE_JSON_CACHE_KEY(article_id), stale_encoded_article)
+        clear_local_cache()
+        self.assertEqual(stale_encoded_article["counts"]["likes_count"], 0)
+        self.assertEqual(get_likes_count(), 1)
+
     def test_like_article_again(self):
         # Post an article
         register_account(self.client, MOCK_USER_1, False)
@@ -382,6 +522,7 @@ class articleModificationTests(APITestCase):
             article=article_instance, user=user_instance
         ).exists()
         self.assertTrue(article_like_exist)
+        flush_counters()
         article_instance = Article.objects.get(pk=article_instance.id)
         self.assertEqual(article_instance.likes_count, 1)
 
@@ -475,6 +616,7 @@ class articleModificationTests(APITestCase):
             article=article_instance, user=user_instance
         ).exists()
         self.assertFalse(article_like_exist)
+        flush_counters()
         article_instance = Article.objects.get(pk=article_instance.id)
         self.assertEqual(article_instance.likes_count, 0)
 
@@ -486,7 +628,8 @@ class articleRetrieveTests(APITestCase):
 
     def setUp(self):
         cache.clear()
-        reset_faiss(get_faiss_index())
+        clear_local_cache()
+        reset_faiss()
         self.client = APIClient()
 
     def test_retrieve_an_article(self):
@@ -620,6 +763,35 @@ class articleRetrieveTests(APITestCase):
             )
             self.assertTrue(previous_article_time > current_article_time)
 
+    def test_retrieve_articles_with_cursor(self):
+
+        register_account(self.client, MOCK_USER_1)
+        for _ in range(PAGINATOR_SIZE + 2):
+            article(self.client, "post", MOCK_ARTICLE)
+
+        # Follow the next links until the feed is exhausted
+        article_ids = []
+        next_url = reverse(ARTICLE_LIST_CREATE_NAME)
+        while next_url:
+            response = self.client.get(next_url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            article_ids += [
+                article["id"] for article in response.data["results"]["articles"]
+            ]
+            next_url = response.data["next"]
+
+        # Validate every article was returned once, newest first
+        expected_ids = list(
+            Article.objects.order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+        self.assertListEqual(article_ids, expected_ids)
+
+        # Validate an invalid cursor is rejected instead of restarting the feed
+        response = self.client.get(
+            reverse(ARTICLE_LIST_CREATE_NAME), {"cursor": "invalid"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_retrieve_articles_sorted_by_score(self):
 
         register_account(self.client, MOCK_USER_1)
@@ -629,6 +801,8 @@ class articleRetrieveTests(APITestCase):
             for _ in range(i):
                 post_comment(self.client, article_instance.id)
 
+        # The comments reach the hot ranking once the counters are flushed
+        flush_counters()
         retrieve_articles_url = reverse(ARTICLE_SCORE_NAME)
         retrieve_articles_response = self.client.get(retrieve_articles_url)
         self.assertEqual(retrieve_articles_response.status_code, status.HTTP_200_OK)
@@ -656,6 +830,46 @@ class articleRetrieveTests(APITestCase):
                 previous_article_comment_count > current_article_comment_count
             )
 
+    def test_hot_articles_decay(self):
+
+        register_account(self.client, MOCK_USER_1)
+        old_article_id = article(self.client, "post", MOCK_ARTICLE).id
+        new_article_id = article(self.client, "post", MOCK_ARTICLE).id
+
+        # More engagement does not keep an old article above a new one
+        Article.objects.filter(pk=old_article_id).update(
+            likes_count=5, created_at=timezone.now() - timedelta(days=3)
+        )
+        rebuild_hot_rankings()
+
+        retrieve_articles_url = reverse(ARTICLE_SCORE_NAME)
+        articles = self.client.get(retrieve_articles_url).data["results"]["articles"]
+        self.assertEqual([a["id"] for a in articles], [new_article_id, old_article_id])
+
+        # Engagement on an article past the window does not bring it back
+        Article.objects.filter(pk=old_article_id).update(
+            created_at=timezone.now() - timedelta(seconds=HOT_WINDOW + 60)
+        )
+        rebuild_hot_rankings()
+        self.client.post(reverse(ARTICLE_LIKE_NAME, kwargs={"pk": old_article_id}))
+        flush_counters()
+        articles = self.client.get(retrieve_articles_url).data["results"]["articles"]
+        self.assertEqual([a["id"] for a in articles], [new_article_id])
+
+    def test_empty_hot_ranking_is_built_once(self):
+
+        register_account(self.client, MOCK_USER_1)
+
+        # A school without articles in the window is not rebuilt on every request
+        with patch(
+            "community.utils.hot_utils.rebuild_hot_rankings", wraps=rebuild_hot_rankings
+        ) as rebuild:
+            for _ in range(2):
+                response = self.client.get(reverse(ARTICLE_SCORE_NAME))
+                self.assertEqual(response.data["count"], 0)
+                self.assertEqual(response.data["results"]["articles"], [])
+        self.assertEqual(rebuild.call_count, 1)
+
     def test_retrieve_articles_sorted_by_preference(self):
 
         register_account(self.client, MOCK_USER_1)
@@ -683,6 +897,7 @@ class articleRetrieveTests(APITestCase):
         )
         retrieve_an_article_response = self.client.get(retrieve_an_article_url)
         self.assertEqual(retrieve_an_article_response.status_code, status.HTTP_200_OK)
+        fold_preference_events()
 
         retrieve_articles_url = reverse(ARTICLE_PREFERENCE_NAME)
         retrieve_articles_response = self.client.get(retrieve_articles_url)
@@ -700,6 +915,404 @@ class articleRetrieveTests(APITestCase):
 
         # print(json.dumps(retrieve_articles_response.data, indent=4))
 
+    def test_feeds_do_not_select_embedding_vector(self):
+
+        register_account(self.client, MOCK_USER_1)
+        article_instance = article(self.client, "post", MOCK_ARTICLE)
+        post_comment(self.client, article_instance.id)
+
+        # The feed rows are built by this projection on every cache miss
+        with CaptureQueriesContext(connection) as context:
+            project_articles(
+                annotate_articles(Article.objects.filter(pk__in=[article_instance.id]))
+            )
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertNotIn("embedding_vector", context.captured_queries[0]["sql"])
+        self.assertNotIn("search_vector", context.captured_queries[0]["sql"])
+
+        requests = [
+            lambda: self.client.get(reverse(ARTICLE_LIST_CREATE_NAME)),
+            lambda: self.client.get(reverse(ARTICLE_SCORE_NAME)),
+            lambda: self.client.post(
+                reverse(ARTICLE_LIKE_NAME, kwargs={"pk": article_instance.id})
+            ),
+        ]
+        for request in requests:
+            with CaptureQueriesContext(connection) as context:
+                response = request()
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            # Neither the user nor the article vector column is selected
+            for query in context.captured_queries:
+                self.assertNotIn("embedding_vector", query["sql"])
+
+    def test_checkpoint_faiss_index(self):
+
+        register_account(self.client, MOCK_USER_1)
+        article_ids = [article(self.client, "post", MOCK_ARTICLE).id for _ in range(3)]
+
+        # New articles only live in the delta log until the checkpoint
+        self.assertEqual(get_faiss_index(FAISS_UNICON_PARTITION).ntotal, 0)
+        self.assertEqual(checkpoint_faiss_index(FAISS_UNICON_PARTITION), len(article_ids))
+
+        # The merged index holds every article and the delta log is empty
+        index = get_faiss_index(FAISS_UNICON_PARTITION)
+        self.assertEqual(index.ntotal, len(article_ids))
+        self.assertEqual(checkpoint_faiss_index(FAISS_UNICON_PARTITION), 0)
+
+        # An overlapping run that trimmed first leaves the newer entries alone
+        delta_cache_key = FAISS_DELTA_CACHE_KEY(FAISS_UNICON_PARTITION)
+        article(self.client, "post", MOCK_ARTICLE)
+        entries = get_redis_connection("default").lrange(delta_cache_key, 0, -1)
+        get_redis_connection("default").ltrim(delta_cache_key, len(entries), -1)
+        article(self.client, "post", MOCK_ARTICLE)
+        self.assertEqual(trim_faiss_delta(FAISS_UNICON_PARTITION, entries), 0)
+        self.assertEqual(len(get_faiss_delta(FAISS_UNICON_PARTITION)), 1)
+
+    def test_faiss_partitions_isolate_schools(self):
+
+        unsw_user = register_account(self.client, MOCK_USER_1)
+        unicon_article_id = article(self.client, "post", MOCK_ARTICLE).id
+        unsw_article_id = article(self.client, "post", MOCK_ARTICLE_WITH_COURSES).id
+        self.client.credentials()
+        uts_user = register_account(self.client, MOCK_USER_3)
+        uts_article_id = article(self.client, "post", MOCK_ARTICLE_WITH_COURSES).id
+        query = get_embedding(MOCK_ARTICLE["title"] + MOCK_ARTICLE["body"])
+
+        def get_visible_article_ids(user_instance):
+            partitions = get_visible_faiss_partitions(user_instance.school.id)
+            return set(search_similar_embeddings(query, partitions).tolist())
+
+        # Each school sees its own articles and the shared UNI.CON partition,
+        # first from the delta logs and then from the checkpointed indexes
+        for _ in range(2):
+            self.assertSetEqual(
+                get_visible_article_ids(unsw_user), {unicon_article_id, unsw_article_id}
+            )
+            self.assertSetEqual(
+                get_visible_article_ids(uts_user), {unicon_article_id, uts_article_id}
+            )
+            for partition in get_all_faiss_partitions():
+                checkpoint_faiss_index(partition)
+
+        index = get_faiss_index(FAISS_SCHOOL_PARTITION(uts_user.school.id))
+        self.assertListEqual(
+            faiss.vector_to_array(index.id_map).tolist(), [uts_article_id]
+        )
+
+    def test_rebuild_faiss_index_types(self):
+
+        user_instance = register_account(self.client, MOCK_USER_1)
+        vectors = np.random.default_rng(0).standard_normal((64, EMBEDDING_VECTOR_SIZE))
+        vectors = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(
+            np.float32
+        )
+        article_ids = [
+            article_instance.id
+            for article_instance in Article.objects.bulk_create(
+                Article(user=user_instance, embedding_vector=vector) for vector in vectors
+            )
+        ]
+
+        # A small PQ keeps the IVF-PQ training fast enough for a test
+        with patch.dict(
+            "community.constants.FAISS_INDEX_FACTORIES",
+            {"ivfpq": lambda size: "IDMap,IVF1,PQ8x4"},
+        ), patch("community.utils.embedding_utils.FAISS_TRAINING_MIN_SIZE", 16):
+            for index_type, index_class in [
+                ("flat", faiss.IndexFlat),
+                ("hnsw", faiss.IndexHNSW),
+                ("ivfpq", faiss.IndexIVFPQ),
+            ]:
+                call_command(
+                    "rebuild_faiss_index",
+                    "--type",
+                    index_type,
+                    "--partition",
+                    FAISS_UNICON_PARTITION,
+                    stdout=StringIO(),
+                )
+
+                # Every stored vector finds its own article first
+                index = get_faiss_index(FAISS_UNICON_PARTITION)
+                self.assertIsInstance(faiss.downcast_index(index.index), index_class)
+                self.assertEqual(index.ntotal, len(article_ids))
+                _, found_ids = index.search(vectors[:16], 1)
+                self.assertListEqual(found_ids[:, 0].tolist(), article_ids[:16])
+
+        # The live index is not replaced while a checkpoint holds the lock
+        with hold_lock(FAISS_CHECKPOINT_LOCK_CACHE_KEY, 60), patch(
+            "community.management.commands.rebuild_faiss_index."
+            "FAISS_CHECKPOINT_LOCK_TIMEOUT",
+            0.1,
+        ):
+            with self.assertRaises(CommandError):
+                call_command("rebuild_faiss_index", stdout=StringIO())
+            call_command("rebuild_faiss_index", "--dry-run", stdout=StringIO())
+
+        # An unknown type fails with a clear error, from the option or the setting
+        with self.assertRaises(CommandError):
+            call_command("rebuild_faiss_index", "--type", "ivf", stdout=StringIO())
+        with override_settings(FAISS_INDEX_TYPE="ivf"):
+            with self.assertRaisesMessage(ImproperlyConfigured, "'ivf'"):
+                call_command("rebuild_faiss_index", stdout=StringIO())
+
+    def test_backfill_embeddings(self):
+
+        register_account(self.client, MOCK_USER_1)
+        article_ids = [article(self.client, "post", MOCK_ARTICLE).id for _ in range(3)]
+        Article.objects.filter(pk__in=article_ids).update(embedding_vector=None)
+
+        # Batched vectors match the ones embedded one text at a time
+        text = MOCK_ARTICLE["title"] + MOCK_ARTICLE["body"]
+        self.assertTrue(np.allclose(get_embeddings([text])[0], get_embedding(text)))
+        self.assertTrue(
+            np.allclose(get_embedding_batcher().embed_queued(text), get_embedding(text))
+        )
+
+        call_command("backfill_embeddings", stdout=StringIO())
+        self.assertFalse(Article.objects.filter(embedding_vector__isnull=True).exists())
+
+    def test_embed_without_batch_partner(self):
+
+        # A lone text never waits for a batch to fill up
+        batcher = EmbeddingBatcher(LocalEmbeddingBackend(), max_wait=60)
+        text = MOCK_ARTICLE["title"] + MOCK_ARTICLE["body"]
+        start_time = time.monotonic()
+        vector = batcher.embed(text)
+        self.assertLess(time.monotonic() - start_time, 1)
+        self.assertTrue(np.allclose(vector, LocalEmbeddingBackend().embed([text])[0]))
+        self.assertIsNone(batcher.pid)
+
+    def test_fold_preference_events(self):
+
+        user_instance = register_account(self.client, MOCK_USER_1)
+        article_ids = [article(self.client, "post", MOCK_ARTICLE).id for _ in range(2)]
+        Article.objects.filter(pk=article_ids[1]).update(
+            embedding_vector=get_embedding("Final exam tips")
+        )
+
+        # Opening an article only queues an event
+        for pk in [article_ids[0], article_ids[1], article_ids[0]]:
+            self.client.get(reverse(ARTICLE_PATCH_DETAIL_DELETE_NAME, kwargs={"pk": pk}))
+        user_instance = User.objects.with_vector().get(pk=user_instance.id)
+        self.assertFalse(user_instance.embedding_vector.any())
+
+        # Folding matches updating the preference once per view, in order
+        expected = user_instance.embedding_vector
+        for pk in [article_ids[0], article_ids[1], article_ids[0]]:
+            expected = update_preference_vector(
+                expected, Article.objects.with_vector().get(pk=pk).embedding_vector
+            )
+        self.assertEqual(fold_preference_events(), 3)
+        user_instance = User.objects.with_vector().get(pk=user_instance.id)
+        self.assertTrue(np.allclose(user_instance.embedding_vector, expected, atol=1e-6))
+        self.assertEqual(fold_preference_events(), 0)
+
+    def test_refresh_preference_feeds(self):
+
+        register_account(self.client, MOCK_USER_1)
+        article_ids = [article(self.client, "post", MOCK_ARTICLE).id for _ in range(2)]
+
+        # The first visit materializes the feed and marks the user active
+        retrieve_articles_url = reverse(ARTICLE_PREFERENCE_NAME)
+        articles = self.client.get(retrieve_articles_url).data["results"]["articles"]
+        self.assertSetEqual({a["id"] for a in articles}, set(article_ids))
+
+        # A new article reaches the feed through the background refresh only
+        new_article_id = article(self.client, "post", MOCK_ARTICLE).id
+        articles = self.client.get(retrieve_articles_url).data["results"]["articles"]
+        self.assertNotIn(new_article_id, {a["id"] for a in articles})
+
+        self.assertEqual(refresh_preference_feeds(), 1)
+        articles = self.client.get(retrieve_articles_url).data["results"]["articles"]
+        self.assertIn(new_article_id, {a["id"] for a in articles})
+        self.assertEqual(refresh_preference_feeds(), 0)
+
+    def test_article_views_are_deduplicated(self):
+
+        user_instance = register_account(self.client, MOCK_USER_1)
+        article_instance = article(self.client, "post", MOCK_ARTICLE)
+        retrieve_an_article_url = reverse(
+            ARTICLE_PATCH_DETAIL_DELETE_NAME, kwargs={"pk": article_instance.id}
+        )
+        for _ in range(3):
+            self.client.get(retrieve_an_article_url)
+
+        # The viewers set expires like the other seeded sets
+        viewers_ttl = get_redis_connection("default").ttl(
+            ARTICLE_VIEWERS_CACHE_KEY(article_instance.id)
+        )
+        self.assertTrue(0 < viewers_ttl <= CACHE_TIMEOUT)
+
+        # One row per viewer, inserted by the batched flush
+        self.assertFalse(ArticleView.objects.exists())
+        self.assertEqual(flush_article_views(), 1)
+        self.assertEqual(
+            ArticleView.objects.filter(
+                user=user_instance, article=article_instance
+            ).count(),
+            1,
+        )
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ArticleView.objects.create(user=user_instance, article=article_instance)
+
+        # Every open is counted unless only unique viewers are configured
+        flush_counters()
+        self.assertEqual(Article.objects.get(pk=article_instance.id).views_count, 3)
+        with self.settings(UNIQUE_ARTICLE_VIEWS=True):
+            self.client.get(retrieve_an_article_url)
+        flush_counters()
+        self.assertEqual(Article.objects.get(pk=article_instance.id).views_count, 3)
+
+    def test_user_article_statuses(self):
+
+        register_account(self.client, MOCK_USER_1)
+        liked_article_id = article(self.client, "post", MOCK_ARTICLE).id
+        viewed_article_id = article(self.client, "post", MOCK_ARTICLE).id
+
+        self.client.post(reverse(ARTICLE_LIKE_NAME, kwargs={"pk": liked_article_id}))
+        self.client.get(
+            reverse(ARTICLE_PATCH_DETAIL_DELETE_NAME, kwargs={"pk": viewed_article_id})
+        )
+
+        # Statuses come from the user's sets, not from the article payloads
+        retrieve_articles_url = reverse(ARTICLE_LIST_CREATE_NAME)
+        articles = self.client.get(retrieve_articles_url).data["results"]["articles"]
+        statuses = {a["id"]: (a["like_status"], a["view_status"]) for a in articles}
+        self.assertEqual(statuses[liked_article_id], (True, False))
+        self.assertEqual(statuses[viewed_article_id], (False, True))
+
+        self.client.post(reverse(ARTICLE_UNLIKE_NAME, kwargs={"pk": liked_article_id}))
+        articles = self.client.get(retrieve_articles_url).data["results"]["articles"]
+        statuses = {a["id"]: a["like_status"] for a in articles}
+        self.assertFalse(statuses[liked_article_id])
+
+    def test_feed_splices_user_fields_into_cached_json(self):
+
+        register_account(self.client, MOCK_USER_1)
+        article_id = article(self.client, "post", MOCK_ARTICLE).id
+        retrieve_articles_url = reverse(ARTICLE_LIST_CREATE_NAME)
+        self.client.get(retrieve_articles_url)
+        self.client.post(reverse(ARTICLE_LIKE_NAME, kwargs={"pk": article_id}))
+
+        # The shared part is cached once, without the user specific fields
+        encoded_article = cache.get(ARTICLE_JSON_CACHE_KEY(article_id))
+        self.assertNotIn(b"like_status", encoded_article["json"])
+
+        # Validate the like shows up before and after the counters are flushed
+        for _ in range(2):
+            response = self.client.get(retrieve_articles_url)
+            self.assertEqual(response["Content-Type"], "application/json")
+            article_data = response.data["results"]["articles"][0]
+            self.assertTrue(article_data["like_status"])
+            self.assertEqual(article_data["likes_count"], 1)
+            flush_counters()
+
+    def test_search_articles(self):
+
+        register_account(self.client, MOCK_USER_1)
+        exam_article = deepcopy(MOCK_ARTICLE)
+        exam_article["title"] = "Final exam tips"
+        exam_article_instance = article(self.client, "post", exam_article)
+        article(self.client, "post", MOCK_ARTICLE)
+
+        # A short keyword query is answered lexically without the embedder
+        search_url = reverse(ARTICLE_SEARCH_NAME)
+        search_response = self.client.get(search_url, {"search_content": "exam"})
+        self.assertEqual(search_response.status_code, status.HTTP_200_OK)
+        articles = search_response.data["results"]["articles"]
+        self.assertEqual([a["id"] for a in articles], [exam_article_instance.id])
+        self.assertEqual(get_query_embedding_stats()["misses"], 0)
+
+        # Longer queries fuse the lexical and the vector rankings
+        search_response = self.client.get(
+            search_url, {"search_content": "tips for the final exam"}
+        )
+        articles = search_response.data["results"]["articles"]
+        self.assertEqual(articles[0]["id"], exam_article_instance.id)
+        self.assertEqual(get_query_embedding_stats()["misses"], 1)
+
+        # Articles without an embedding yet are not found lexically either
+        Article.objects.filter(pk=exam_article_instance.id).update(embedding_vector=None)
+        cache.clear()
+        clear_local_cache()
+        search_response = self.client.get(
+            search_url, {"search_content": "exam", "mode": "lexical"}
+        )
+        self.assertEqual(search_response.data["results"]["articles"], [])
+
+        search_response = self.client.get(
+            search_url, {"search_content": "exam", "mode": "unknown"}
+        )
+        self.assertEqual(search_response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_query_embedding_cache(self):
+
+        # Queries differing only in case and spacing share one embedding
+        embedding = get_query_embedding("COMP1511  exam")
+        self.assertTrue(np.allclose(get_query_embedding("comp1511 exam"), embedding))
+        self.assertTrue(np.allclose(get_embedding("comp1511 exam"), embedding))
+
+        # A local hit skips Redis, it is counted with the next stats write
+        with patch("community.utils.embedding_utils.get_redis_connection") as redis:
+            self.assertTrue(np.allclose(get_query_embedding("comp1511 exam"), embedding))
+        redis.assert_not_called()
+
+        stats = get_query_embedding_stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["local_hits"], 2)
+        self.assertAlmostEqual(stats["hit_rate"], 2 / 3)
+
+    def test_cache_rebuild_is_single_flight(self):
+        rebuilt_ids = []
+
+        def rebuild(value):
+            rebuilt_ids.append("TEST_KEY")
+            return "rebuilt"
+
+        # Validate a miss is rebuilt once and then served from the cache
+        self.assertEqual(get_or_rebuild("TEST_KEY", rebuild), "rebuilt")
+        self.assertEqual(get_or_rebuild("TEST_KEY", rebuild), "rebuilt")
+        self.assertEqual(len(rebuilt_ids), 1)
+
+        # Validate a worker waits while another one holds the rebuild lock
+        cache.delete("TEST_KEY")
+        cache.add(CACHE_REBUILD_LOCK_CACHE_KEY("TEST_KEY"), 1)
+        threading.Timer(0.1, cache.set, ["TEST_KEY", "rebuilt elsewhere"]).start()
+        self.assertEqual(get_or_rebuild("TEST_KEY", rebuild), "rebuilt elsewhere")
+        self.assertEqual(len(rebuilt_ids), 1)
+
+        # Validate only the missing keys without a rebuild in flight are rebuilt
+        def rebuild_many(ids):
+            rebuilt_ids.extend(ids)
+            return {pk: f"rebuilt {pk}" for pk in ids}
+
+        cache.set("TEST_KEY_1", "cached 1")
+        cache.add(CACHE_REBUILD_LOCK_CACHE_KEY("TEST_KEY_2"), 1)
+        threading.Timer(0.1, cache.set, ["TEST_KEY_2", "rebuilt elsewhere 2"]).start()
+        values = get_many_or_rebuild(
+            {pk: f"TEST_KEY_{pk}" for pk in [1, 2, 3]}, rebuild_many
+        )
+        self.assertDictEqual(
+            values, {1: "cached 1", 2: "rebuilt elsewhere 2", 3: "rebuilt 3"}
+        )
+        self.assertListEqual(rebuilt_ids, ["TEST_KEY", 3])
+
+    def test_local_cache_invalidation(self):
+
+        def rebuild(value):
+            return "rebuilt"
+
+        # Validate the local tier serves the value without reading Redis again
+        self.assertEqual(get_or_rebuild("TEST_KEY", rebuild, local=True), "rebuilt")
+        cache.set("TEST_KEY", "changed")
+        self.assertEqual(get_or_rebuild("TEST_KEY", rebuild, local=True), "rebuilt")
+
+        # Validate an invalidation drops the local copy
+        invalidate_cache(["TEST_KEY"])
+        self.assertEqual(get_or_rebuild("TEST_KEY", rebuild, local=True), "changed")
+
 
 class commentModificationTests(APITestCase):
     # Post, Like, Patch, Delete
@@ -708,6 +1321,7 @@ class commentModificationTests(APITestCase):
 
     def setUp(self):
         cache.clear()
+        clear_local_cache()
         self.client = APIClient()
 
     def test_post_comment(self):
@@ -732,6 +1346,7 @@ class commentModificationTests(APITestCase):
         comment_instance = Comment.objects.get(pk=post_comment_response.data["id"])
         self.assertEqual(comment_instance.user, user_instance)
         self.assertEqual(comment_instance.body, MOCK_COMMENT["body"])
+        flush_counters()
         article_instance = Article.objects.get(pk=article_instance.id)
         self.assertEqual(article_instance.comments_count, 1)
 
@@ -769,6 +1384,7 @@ class commentModificationTests(APITestCase):
         )
         self.assertEqual(nested_comment_instance.user, user_instance)
         self.assertEqual(nested_comment_instance.body, MOCK_COMMENT["body"])
+        flush_counters()
         parent_comment_instance = Comment.objects.get(pk=post_comment_response.data["id"])
         self.assertEqual(parent_comment_instance.comments_count, 1)
         article_instance = Article.objects.get(pk=article_instance.id)
@@ -928,6 +1544,7 @@ class commentModificationTests(APITestCase):
             comment=post_comment_response.data["id"], user=user_instance
         ).exists()
         self.assertTrue(comment_like_exist)
+        flush_counters()
         comment_instance = Comment.objects.get(pk=post_comment_response.data["id"])
         self.assertEqual(comment_instance.likes_count, 1)
 
@@ -987,6 +1604,7 @@ class commentModificationTests(APITestCase):
             comment=post_comment_response.data["id"], user=user_instance
         ).exists()
         self.assertTrue(comment_like_exist)
+        flush_counters()
         comment_instance = Comment.objects.get(pk=post_comment_response.data["id"])
         self.assertEqual(comment_instance.likes_count, 1)
 
@@ -1039,6 +1657,7 @@ class commentModificationTests(APITestCase):
             comment=post_comment_response.data["id"], user=user_instance
         ).exists()
         self.assertFalse(comment_like_exist)
+        flush_counters()
         comment_instance = Comment.objects.get(pk=post_comment_response.data["id"])
         self.assertEqual(comment_instance.likes_count, 0)
 
@@ -1104,6 +1723,7 @@ class commentModificationTests(APITestCase):
             comment=post_comment_response.data["id"], user=user_instance
         ).exists()
         self.assertFalse(comment_like_exist)
+        flush_counters()
         comment_instance = Comment.objects.get(pk=post_comment_response.data["id"])
         self.assertEqual(comment_instance.likes_count, 0)
 
@@ -1114,6 +1734,7 @@ class commentRetrieveTests(APITestCase):
 
     def setUp(self):
         cache.clear()
+        clear_local_cache()
         self.client = APIClient()
 
     def test_retrieve_nested_comments(self):
@@ -1142,3 +1763,141 @@ class commentRetrieveTests(APITestCase):
             nested_comment_instance.id,
             retrieve_comment_response.data["results"]["comments"][0]["id"],
         )
+
+
+class projectionTests(APITestCase):
+    # Projections against the response serializers they replace
+
+    fixtures = ["fixtures.json"]
+
+    def setUp(self):
+        cache.clear()
+        clear_local_cache()
+        self.client = APIClient()
+
+    def test_projections_match_response_serializers(self):
+
+        user_instance = register_account(self.client, MOCK_USER_1)
+        article_instance = article(self.client, "post", MOCK_ARTICLE)
+        comment_instance = post_comment(self.client, article_instance.id)
+        post_comment(self.client, article_instance.id, comment_instance.id)
+        Notification.objects.create(
+            group=0,
+            user=user_instance,
+            content_type=ContentType.objects.get_for_model(Comment),
+            object_id=comment_instance.id,
+        )
+
+        # Validate the same keys, in the same order, with the same values
+        for queryset, aggregates, project, serializer_class in [
+            (
+                annotate_articles(Article.objects.all()),
+                ARTICLE_AGGREGATES,
+                project_articles,
+                ArticleResponseSerializer,
+            ),
+            (
+                annotate_comments(Comment.objects.all()),
+                {},
+                project_comments,
+                CommentResponseSerializer,
+            ),
+            (
+                annotate_notifications(Notification.objects.all()),
+                {},
+                project_notifications,
+                NotificationResponseSerializer,
+            ),
+        ]:
+            serialized = serializer_class(queryset.annotate(**aggregates), many=True).data
+            self.assertListEqual(
+                [list(item.items()) for item in project(queryset)],
+                [list(item.items()) for item in serialized],
+            )
+
+    def test_annotations_are_joined_not_correlated(self):
+
+        register_account(self.client, MOCK_USER_1)
+        article_instance = article(self.client, "post", MOCK_ARTICLE_WITH_COURSES)
+        post_comment(self.client, article_instance.id)
+
+        # One SELECT each, and no correlated subquery in the query plan
+        for queryset, project in [
+            (annotate_articles(Article.objects.all()), project_articles),
+            (annotate_comments(Comment.objects.all()), project_comments),
+        ]:
+            with CaptureQueriesContext(connection) as queries:
+                project(queryset)
+            self.assertEqual(len(queries.captured_queries), 1)
+            sql = queries.captured_queries[0]["sql"]
+            self.assertEqual(sql.upper().count("SELECT"), 1)
+            with connection.cursor() as cursor:
+                if connection.vendor == "postgresql":
+                    cursor.execute("EXPLAIN " + sql)
+                    self.assertNotIn("SubPlan", str(cursor.fetchall()))
+                else:
+                    cursor.execute("EXPLAIN QUERY PLAN " + sql)
+                    self.assertNotIn("CORRELATED", str(cursor.fetchall()))
+
+        # Validate every course code is aggregated, not only the first one
+        cache.clear()
+        clear_local_cache()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(ARTICLE_LIST_CREATE_NAME))
+        course_code = response.data["results"]["articles"][0]["course_code"]
+        self.assertSetEqual(
+            set(course_code.split(",")),
+            {code.upper() for code in MOCK_ARTICLE_WITH_COURSES["course_code"]},
+        )
+        self.assertEqual(
+            len(
+                [
+                    query
+                    for query in queries.captured_queries
+                    if "community_articlecourse" in query["sql"]
+                ]
+            ),
+            1,
+        )
+
+
+class cacheSerializationTests(APITestCase):
+    # Cached values go through msgpack and zstd instead of pickle
+
+    def setUp(self):
+        cache.clear()
+        clear_local_cache()
+
+    def test_cache_values_round_trip(self):
+
+        serializer = MsgPackSerializer({})
+        compressor = ZstdCompressor({"COMPRESS_MIN_LENGTH": 1024})
+        created_at = timezone.now()
+
+        # Integer keyed like the comment caches, below and above the threshold
+        small_value = {1: {"id": 1, "created_at": created_at, "parent_comment": None}}
+        large_value = {
+            pk: {"id": pk, "body": MOCK_COMMENT["body"], "created_at": created_at}
+            for pk in range(100)
+        }
+
+        for value, compressed in [(small_value, False), (large_value, True)]:
+            dumped = serializer.dumps(value)
+            self.assertEqual(len(dumped) >= compressor.min_length, compressed)
+            stored = compressor.compress(dumped)
+            self.assertEqual(stored.startswith(ZSTD_MAGIC), compressed)
+
+            # Validate small values are left for the caller to load as is
+            if compressed:
+                loaded = serializer.loads(compressor.decompress(stored))
+            else:
+                self.assertEqual(stored, dumped)
+                with self.assertRaises(CompressorError):
+                    compressor.decompress(stored)
+                loaded = serializer.loads(stored)
+            self.assertEqual(loaded, value)
+            self.assertEqual(loaded[1]["created_at"].utcoffset(), timedelta(0))
+
+            # Validate the same through the configured cache
+            cache.set("CACHE_SERIALIZATION_TEST", value, timeout=CACHE_TIMEOUT)
+            self.assertEqual(cache.get("CACHE_SERIALIZATION_TEST"), value)
@@ -1,22 +1,27 @@
 from .article_helpers import (
-    update_user_commented_article_cache,
     update_user_viewed_article_cache,
     update_user_saved_article_cache,
     update_user_liked_article_cache,
     get_paginated_articles,
+    get_paginated_ranked_articles,
+    get_paginated_ranked_article_ids,
+    get_paginated_ranked_page,
     get_serialized_article,
+    annotate_articles,
     update_article,
 )
 
 from .comment_helpers import (
     update_user_liked_comments_cache,
     get_paginated_comments,
+    annotate_comments,
     update_comment,
     add_comment,
 )
 
 from .notification_helpers import (
     get_paginated_notifications,
+    annotate_notifications,
     add_notification
 )
 
@@ -27,10 +32,65 @@ from .database_utils import (
 )
 from .embedding_utils import (
     get_embedding,
+    get_embeddings,
+    get_query_embedding,
+    get_query_embedding_stats,
     update_preference_vector,
+    record_preference_event,
+    fold_preference_events,
     add_embedding_to_faiss,
     search_similar_embeddings,
     reset_faiss,
     get_faiss_index,
+    checkpoint_faiss_index,
+    load_article_vectors,
+    build_faiss_index,
+    get_faiss_partition,
+    get_visible_faiss_partitions,
+    get_all_faiss_partitions,
+)
+from .search_utils import (
+    update_article_search_vector,
+    search_lexical_article_ids,
+    search_vector_article_ids,
+    search_hybrid_article_ids,
+)
+from .preference_utils import (
+    materialize_preference_feeds,
+    refresh_preference_feeds,
+    get_preference_feed,
+    mark_new_preference_articles,
+)
+from .counter_utils import (
+    increment_article_counter,
+    increment_comment_counter,
+    overlay_article_counters,
+    overlay_comment_counters,
+    flush_counters,
+)
+from .view_utils import (
+    record_article_view,
+    flush_article_views,
+)
+from .cache_utils import (
+    get_or_rebuild,
+    get_many_or_rebuild,
+    invalidate_cache,
+    clear_local_cache,
+    hold_lock,
+)
+from .json_utils import JSONBytesResponse
+from .projections import (
+    compile_projection,
+    ARTICLE_AGGREGATES,
+    project_articles,
+    project_comments,
+    project_notifications,
+)
+from .hot_utils import (
+    rebuild_hot_rankings,
+    update_hot_score,
+    update_hot_scores,
+    get_hot_article_ids,
 )
 from .response_serializers import ArticleResponseSerializer, CommentResponseSerializer
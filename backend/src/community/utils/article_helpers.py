@@ -1,206 +1,203 @@
 from community.constants import (
-    CACHE_TIMEOUT,
     PAGINATOR_SIZE,
+    RANKED_ARTICLES_WINDOW_SIZE,
     ARTICLE_CACHE_KEY,
-    ARTICLES_CACHE_KEY,
-    ARTICLES_LIKE_CACHE_KEY,
-    ARTICLES_VIEW_CACHE_KEY,
-    ARTICLES_SAVE_CACHE_KEY
+    ARTICLE_JSON_CACHE_KEY,
+    ARTICLE_COUNTER_FIELDS,
+    ARTICLE_STATUS_FIELDS,
 )
-from community.models import Article, ArticleUser, ArticleCourse, ArticleLike, ArticleView, ArticleSave, Comment
-from django.db.models import OuterRef, Subquery, F, Func, Value
+from community.models import Article, ArticleUser, ArticleCourse
+from django.db.models import FilteredRelation, F, Q
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.exceptions import ParseError
+from base64 import urlsafe_b64encode, urlsafe_b64decode
 from .response_serializers import ArticleResponseSerializer
-from .database_utils import update_article_engagement_score
-from django.db.models.functions import Coalesce
+from .search_utils import update_article_search_vector
+from .counter_utils import (
+    overlay_article_counters,
+    get_article_counter_overlays,
+    overlay_counts,
+)
+from .json_utils import encode_shared_json, splice_json, encode_page
+from .projections import project_articles
+from .status_utils import get_user_statuses, set_user_status
+from .cache_utils import get_or_rebuild, get_many_or_rebuild, invalidate_cache
 from django.core.cache import cache
-from account.models import User
-from django.urls import resolve
 from django.db import transaction
+from datetime import datetime
+import json
+import math
 
 
-def get_paginated_articles(request, queryset, cache_key=None):
-    if cache_key is None:
-        view_name = resolve(request.path).view_name
-        school = request.user.school.id
-        cache_key = ARTICLES_CACHE_KEY(school, view_name)
+def encode_cursor(created_at, pk):
+    return urlsafe_b64encode(json.dumps([created_at.isoformat(), pk]).encode()).decode()
 
-    # Cache the all article ids for the school
-    all_article_ids = cache.get(cache_key, None)
-    if all_article_ids is None:
-        all_article_ids = list(queryset.values_list("id", flat=True))
-        cache.set(cache_key, all_article_ids, CACHE_TIMEOUT)
 
-    # Calculate the number of articles created
-    articles_count = len(all_article_ids)
-    try:
-        user_specific_articles_count = int(
-            request.query_params.get("count", articles_count)
+def decode_cursor(cursor):
+    created_at, pk = json.loads(urlsafe_b64decode(cursor.encode()))
+    return datetime.fromisoformat(created_at), int(pk)
+
+
+def get_paginated_articles(request, queryset):
+    queryset = queryset.order_by("-created_at", "-id")
+
+    # Continue right after the last article of the previous page
+    cursor = request.query_params.get("cursor")
+    if cursor:
+        # Reject a broken cursor, falling back to the first page would loop a client
+        try:
+            created_at, pk = decode_cursor(cursor)
+        except Exception:
+            raise ParseError("The cursor is invalid.")
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+        )
+
+    # One indexed range scan, the extra row tells if there is a next page
+    rows = list(queryset.values_list("id", "created_at")[: PAGINATOR_SIZE + 1])
+    page_article_ids = [pk for pk, _ in rows[:PAGINATOR_SIZE]]
+
+    encoded_articles = get_encoded_articles(request.user, page_article_ids)
+
+    # Construct the response data with the cursor of the next page
+    if len(rows) > PAGINATOR_SIZE:
+        pk, created_at = rows[PAGINATOR_SIZE - 1]
+        next_page = replace_query_param(
+            request.build_absolute_uri(), "cursor", encode_cursor(created_at, pk)
         )
+    else:
+        next_page = None
+    return encode_page(next_page, "articles", encoded_articles)
+
+
+def get_paginated_ranked_articles(request, queryset, cache_key, fetch_ranked_ids):
+    try:
+        page_number = int(request.query_params.get("page", 1))
     except Exception:
-        user_specific_articles_count = articles_count
-    new_articles_count = articles_count - user_specific_articles_count
+        page_number = 1
+    start_index = (page_number - 1) * PAGINATOR_SIZE
+    end_index = start_index + PAGINATOR_SIZE
+
+    # Cache a bounded window of the ranking instead of every article id
+    def covers_page(ranked_articles):
+        return (
+            len(ranked_articles["article_ids"]) >= end_index
+            or ranked_articles["exhausted"]
+        )
+
+    def rebuild(ranked_articles):
+        # Continue the search with a larger window when the page is past it
+        windows = math.ceil(end_index / RANKED_ARTICLES_WINDOW_SIZE)
+        k = windows * RANKED_ARTICLES_WINDOW_SIZE
+        article_ids = [int(pk) for pk in fetch_ranked_ids(k)]
+        return {"article_ids": article_ids, "exhausted": len(article_ids) < k}
+
+    ranked_articles = get_or_rebuild(cache_key, rebuild, covers_page, local=True)
+
+    return get_paginated_ranked_article_ids(
+        request, queryset, ranked_articles["article_ids"], ranked_articles["exhausted"]
+    )
+
+
+def get_paginated_ranked_article_ids(request, queryset, article_ids, exhausted=True):
+    def fetch_page(start_index, end_index):
+        return article_ids[start_index:end_index], len(article_ids)
+
+    return get_paginated_ranked_page(request, queryset, fetch_page, exhausted)
 
-    # Slice for the portion of the key based on the page
+
+def get_paginated_ranked_page(request, queryset, fetch_page, exhausted=True):
     try:
         page_number = int(request.query_params.get("page", 1))
     except Exception:
         page_number = 1
-    start_index = (page_number - 1) * PAGINATOR_SIZE + new_articles_count
-    end_index = min(articles_count, start_index + PAGINATOR_SIZE + new_articles_count)
-    page_article_ids = all_article_ids[start_index:end_index]
+    start_index = (page_number - 1) * PAGINATOR_SIZE
+    end_index = start_index + PAGINATOR_SIZE
+
+    # Only the ids of the requested page are fetched from the ranking
+    page_article_ids, articles_count = fetch_page(start_index, end_index)
 
-    serialized_annotated_articles = get_serialized_articles(
-        request.user, page_article_ids, queryset
+    # Intersect the page with the visibility filter, keeping the ranked order
+    visible_article_ids = set(
+        queryset.filter(pk__in=page_article_ids).values_list("id", flat=True)
     )
+    page_article_ids = [pk for pk in page_article_ids if pk in visible_article_ids]
+
+    encoded_articles = get_encoded_articles(request.user, page_article_ids)
 
     # Construct the response data with necessary pagination attributes
     url = request.build_absolute_uri()
-    if end_index < articles_count:
-        next_page = (
-            f"{url.split('?')[0]}?"
-            f"page={page_number + 1}&"
-            f"count={user_specific_articles_count}"
-        )
+    if end_index < articles_count or not exhausted:
+        next_page = f"{url.split('?')[0]}?page={page_number + 1}"
     else:
         next_page = None
-    return {
-        "count": user_specific_articles_count,
-        "next": next_page,
-        "results": {"articles": serialized_annotated_articles},
-    }
+    return encode_page(next_page, "articles", encoded_articles, articles_count)
 
 
-def get_serialized_articles(user_instance, article_ids, queryset):
-    # Bulk cache the articles in the page
-    missing_ids = []
-    serialized_annotated_articles = []
-    serialized_annotated_articles_cache = cache.get_many(
-        [ARTICLE_CACHE_KEY(pk) for pk in article_ids]
+def get_encoded_articles(user_instance, article_ids):
+    # Bulk cache the shared part of the articles as JSON bytes
+    encoded_articles = get_many_or_rebuild(
+        {pk: ARTICLE_JSON_CACHE_KEY(pk) for pk in article_ids},
+        lambda missing_ids: encode_articles(serialize_articles(missing_ids)),
+        local=True,
     )
-    for pk in article_ids:
-        cache_key = ARTICLE_CACHE_KEY(pk)
-        serialized_annotated_article = serialized_annotated_articles_cache.get(
-            cache_key, None
+    article_ids = [pk for pk in article_ids if pk in encoded_articles]
+
+    # Check the user specific status and the pending counts of the page ids only
+    statuses = get_user_statuses(user_instance.id, article_ids, ARTICLE_STATUS_FIELDS)
+    overlays = get_article_counter_overlays(article_ids)
+
+    # Splice them into the shared part while maintain the order
+    return [
+        splice_json(
+            encoded_articles[pk]["json"],
+            {
+                **overlay_counts(encoded_articles[pk]["counts"], *overlays[pk]),
+                **{status: members[pk] for status, members in statuses.items()},
+            },
         )
+        for pk in article_ids
+    ]
 
-        # Collect the missing article ids
-        if serialized_annotated_article is None:
-            missing_ids.append(pk)
-            serialized_annotated_articles.append(pk)
-        else:
-            serialized_annotated_articles.append(serialized_annotated_article)
-
-    # Query all of the missing article ids
-    missing_annotated_article_queryset = queryset.filter(pk__in=missing_ids).annotate(
-        user_school=Subquery(
-            User.objects.filter(id=OuterRef("user")).values("school__initial")[:1]
-        ),
-        user_temp_name=Subquery(
-            ArticleUser.objects.filter(
-                article=OuterRef("pk"), user=OuterRef("user")
-            ).values("user_temp_name")[:1]
-        ),
-        user_static_points=Subquery(
-            ArticleUser.objects.filter(
-                article=OuterRef("pk"), user=OuterRef("user")
-            ).values("user_static_points")[:1]
-        ),
-        course_code=Coalesce(
-            Subquery(
-                ArticleCourse.objects.filter(article=OuterRef("pk"))
-                .values("course__code")
-                .annotate(
-                    course_codes=Func(
-                        F("course__code"), Value(","), function="STRING_AGG"
-                    )
-                )
-                .values("course_codes")[:1],
-            ),
-            Value(""),
-        ),
-    )
 
-    # Serialized the missing articles
-    missing_serialized_annotated_articles = ArticleResponseSerializer(
-        missing_annotated_article_queryset, many=True
-    ).data
-
-    # Set annotated article cache in bulk
-    missing_serialized_annotated_articles = {
-        ARTICLE_CACHE_KEY(article["id"]): article
-        for article in missing_serialized_annotated_articles
+def encode_articles(serialized_articles):
+    # The counts are kept apart to be overlaid with the live ones
+    return {
+        pk: {
+            "json": encode_shared_json(
+                article, ARTICLE_COUNTER_FIELDS + ARTICLE_STATUS_FIELDS
+            ),
+            "counts": {field: article[field] for field in ARTICLE_COUNTER_FIELDS},
+        }
+        for pk, article in serialized_articles.items()
     }
-    cache.set_many(missing_serialized_annotated_articles, timeout=CACHE_TIMEOUT)
-
-    # Cache user like status in bulk
-    cache_key = ARTICLES_LIKE_CACHE_KEY(user_instance.id)
-    user_liked_articles = cache.get(cache_key, None)
-    if user_liked_articles is None:
-        user_liked_articles = ArticleLike.objects.filter(user=user_instance).values_list(
-            "article", flat=True
-        )
-        user_liked_articles = {pk: True for pk in user_liked_articles}
-        cache.set(cache_key, user_liked_articles, CACHE_TIMEOUT)
-
-    # Cache user view status in bulk
-    cache_key = ARTICLES_VIEW_CACHE_KEY(user_instance.id)
-    user_viewed_articles = cache.get(cache_key, None)
-    if user_viewed_articles is None:
-        user_viewed_articles = ArticleLike.objects.filter(user=user_instance).values_list(
-            "article", flat=True
-        )
-        user_viewed_articles = {pk: True for pk in user_viewed_articles}
-        cache.set(cache_key, user_viewed_articles, CACHE_TIMEOUT)
-
-    # Cache user save status in bulk
-    cache_key = ARTICLES_SAVE_CACHE_KEY(user_instance.id)
-    user_saved_articles = cache.get(cache_key, None)
-    if user_saved_articles is None:
-        user_saved_articles = ArticleSave.objects.filter(user=user_instance).values_list(
-            "article", flat=True
-        )
-        user_saved_articles = {pk: True for pk in user_saved_articles}
-        cache.set(cache_key, user_saved_articles, CACHE_TIMEOUT)
-
-    # Insert the articles and attach user specific data while maintain the order
-    for i, pk_or_article in enumerate(serialized_annotated_articles):
-
-        # For missed articles only
-        if isinstance(pk_or_article, int):
 
-            # Insert the missed article to the result
-            serialized_annotated_articles[i] = missing_serialized_annotated_articles.get(
-                ARTICLE_CACHE_KEY(pk_or_article)
-            )
 
-        # Attach user specific data
-        like_status = user_liked_articles.get(
-            serialized_annotated_articles[i]["id"], False
-        )
-        serialized_annotated_articles[i]["like_status"] = like_status
-
-        view_status = user_viewed_articles.get(
-            serialized_annotated_articles[i]["id"], False
-        )
-        serialized_annotated_articles[i]["view_status"] = view_status
+def serialize_articles(article_ids):
+    # The ids were already filtered by the feed, query them without its joins
+    missing_serialized_annotated_articles = project_articles(
+        annotate_articles(Article.objects.filter(pk__in=article_ids))
+    )
+    return {article["id"]: article for article in missing_serialized_annotated_articles}
 
-        save_status = user_saved_articles.get(
-            serialized_annotated_articles[i]["id"], False
-        )
-        serialized_annotated_articles[i]["save_status"] = save_status
 
-    return serialized_annotated_articles
+def annotate_articles(queryset):
+    # Joins instead of per-row subqueries, the author has one ArticleUser per article
+    # The course codes are aggregated by project_articles, after values()
+    return queryset.annotate(
+        author=FilteredRelation("articleuser", condition=Q(articleuser__user=F("user"))),
+        user_school=F("user__school__initial"),
+        user_temp_name=F("author__user_temp_name"),
+        user_static_points=F("author__user_static_points"),
+    )
 
 
 def get_serialized_article(request, article_instance):
 
-    # Cache the annotated article
-    cache_key = ARTICLE_CACHE_KEY(article_instance.id)
-    serialized_annotated_article = cache.get(cache_key, None)
     user_instance = request.user
 
-    # If the cache missed
-    if serialized_annotated_article is None:
+    # Cache the annotated article, only one worker rebuilds it on a miss
+    def rebuild(serialized_annotated_article):
 
         # Annotate article instance
         article_instance.user_school = article_instance.user.school.initial
@@ -215,38 +212,20 @@ def get_serialized_article(request, article_instance):
         article_instance.course_code = ", ".join(course_codes) if course_codes else ""
 
         # Make an annotated_article to set the cache
-        serialized_annotated_article = ArticleResponseSerializer(article_instance).data
-        cache.set(cache_key, serialized_annotated_article, timeout=CACHE_TIMEOUT)
+        return ArticleResponseSerializer(article_instance).data
 
-    # Attache the user specific attribute
-    cache_key = ARTICLES_LIKE_CACHE_KEY(user_instance.id)
-    user_liked_articles = cache.get(cache_key, None)
-    
-    cache_key = ARTICLES_SAVE_CACHE_KEY(user_instance.id)
-    user_saved_articles = cache.get(cache_key, None)
-
-    # If the cache miss fetch them
-    if user_liked_articles is None:
-        user_liked_articles = ArticleLike.objects.filter(user=user_instance).values_list(
-            "article", flat=True
-        )
-        user_liked_articles = {pk: True for pk in user_liked_articles}
-        cache.set(cache_key, user_liked_articles, CACHE_TIMEOUT)
-
-    like_status = user_liked_articles.get(article_instance.id, False)
-    serialized_annotated_article["like_status"] = like_status
-
-    if user_saved_articles is None:
-        user_saved_articles = ArticleSave.objects.filter(user=user_instance).values_list(
-            "article", flat=True
-        )
-        user_saved_articles = {pk: True for pk in user_saved_articles}
-        cache.set(cache_key, user_saved_articles, CACHE_TIMEOUT)
+    serialized_annotated_article = get_or_rebuild(
+        ARTICLE_CACHE_KEY(article_instance.id), rebuild, local=True
+    )
 
-    save_status = user_saved_articles.get(article_instance.id, False)
-    serialized_annotated_article["save_status"] = save_status
+    # Attache the user specific attribute
+    statuses = get_user_statuses(
+        user_instance.id, [article_instance.id], ["like_status", "save_status"]
+    )
+    for status, members in statuses.items():
+        serialized_annotated_article[status] = members[article_instance.id]
 
-    return serialized_annotated_article
+    return overlay_article_counters([serialized_annotated_article])[0]
 
 def update_article(article_instance, updated_fields=None):
     if updated_fields is None:
@@ -256,74 +235,28 @@ def update_article(article_instance, updated_fields=None):
     with transaction.atomic():
         # Update attributes for updated fields in the permanent database
         Article.objects.filter(pk=article_instance.id).update(**updated_fields)
-        update_article_engagement_score(article_instance)
+        if "title" in updated_fields or "body" in updated_fields:
+            update_article_search_vector(article_instance.id)
         article_instance.refresh_from_db()
-    
-    # Update the cache
-    cache_key = ARTICLE_CACHE_KEY(article_instance.id)
-    serialized_annotated_article = cache.get(cache_key, None)
 
-    if serialized_annotated_article:
-        for field in updated_fields.keys():
-            serialized_annotated_article[field] = getattr(article_instance, field)
-
-        cache.set(cache_key, serialized_annotated_article, timeout=CACHE_TIMEOUT)
+    # Drop both cached copies rather than patching them, a rebuild racing the
+    # update could overwrite the patch with the article it read before the update
+    cache_keys = [
+        ARTICLE_CACHE_KEY(article_instance.id),
+        ARTICLE_JSON_CACHE_KEY(article_instance.id),
+    ]
+    cache.delete_many(cache_keys)
+    invalidate_cache(cache_keys)
 
 def update_user_liked_article_cache(request, article_instance, like_status):
     user_instance = request.user
-    cache_key = ARTICLES_LIKE_CACHE_KEY(user_instance.id)
-    user_liked_articles = cache.get(cache_key, None)
-    if user_liked_articles is None:
-        user_liked_articles = ArticleLike.objects.filter(
-            user=user_instance
-        ).values_list("article", flat=True)
-        user_liked_articles = {pk: True for pk in user_liked_articles}
-    else:
-        user_liked_articles[article_instance.id] = like_status
-    cache.set(cache_key, user_liked_articles, CACHE_TIMEOUT)
-    
-    cache_key = ARTICLES_CACHE_KEY(request.user.school.id, "article-liked-articles", request.user.id)
-    cache.set(cache_key, list(user_liked_articles.keys()), CACHE_TIMEOUT)
+    set_user_status(user_instance.id, article_instance.id, "like_status", like_status)
 
 def update_user_saved_article_cache(request, article_instance, save_status):
 
     user_instance = request.user
-    cache_key = ARTICLES_SAVE_CACHE_KEY(user_instance.id)
-    user_saved_articles = cache.get(cache_key, None)
-    if user_saved_articles is None:
-        user_saved_articles = ArticleSave.objects.filter(
-            user=user_instance
-        ).values_list("article", flat=True)
-        user_saved_articles = {pk: True for pk in user_saved_articles}
-    else:
-        user_saved_articles[article_instance.id] = save_status
-    cache.set(cache_key, user_saved_articles, CACHE_TIMEOUT)
-    
-    cache_key = ARTICLES_CACHE_KEY(request.user.school.id, "article-saved-articles", request.user.id)
-    cache.set(cache_key, list(user_saved_articles.keys()), CACHE_TIMEOUT)
+    set_user_status(user_instance.id, article_instance.id, "save_status", save_status)
 
 def update_user_viewed_article_cache(request, article_instance):
-    user_instance = request.user
-    cache_key = ARTICLES_VIEW_CACHE_KEY(user_instance.id)
-    user_viewed_articles = cache.get(cache_key, None)
-    if user_viewed_articles is None:
-        user_viewed_articles = ArticleView.objects.filter(
-            user=user_instance
-        ).values_list("article", flat=True)
-        user_viewed_articles = {pk: True for pk in user_viewed_articles}
-    else:
-        user_viewed_articles[article_instance.id] = True
-    cache.set(cache_key, user_viewed_articles, CACHE_TIMEOUT)
-
-def update_user_commented_article_cache(request, article_instance):
-
-    user_instance = request.user
-    cache_key = ARTICLES_CACHE_KEY(request.user.school.id, "article-commented-articles", request.user.id)
-    user_commented_articles_ids = cache.get(cache_key, None)
-    if user_commented_articles_ids is None:
-        user_commented_articles_ids = list(Comment.objects.filter(
-            user=user_instance
-        ).values_list("article", flat=True))
-    else:
-        user_commented_articles_ids.append(article_instance.id)
-    cache.set(cache_key, user_commented_articles_ids, CACHE_TIMEOUT)
+    # The view row itself may still be waiting for the batched insert
+    set_user_status(request.user.id, article_instance.id, "view_status", True)
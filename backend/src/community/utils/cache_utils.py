@@ -0,0 +1,279 @@
+from community.constants import (
+    CACHE_TIMEOUT,
+    CACHE_REBUILD_LOCK_CACHE_KEY,
+    CACHE_REBUILD_LOCK_TIMEOUT,
+    CACHE_REBUILD_WAIT,
+    CACHE_REBUILD_POLL_INTERVAL,
+    CACHE_EARLY_REFRESH_DELTA,
+    CACHE_EARLY_REFRESH_BETA,
+    CACHE_INVALIDATION_CHANNEL,
+    CACHE_LOCAL_SIZE,
+    CACHE_LOCAL_TIMEOUT,
+)
+from django_redis import get_redis_connection
+from django.core.cache import cache
+from redis.exceptions import LockNotOwnedError
+from collections import OrderedDict
+from contextlib import contextmanager
+import threading
+import random
+import json
+import copy
+import math
+import time
+import os
+
+
+class LocalCache:
+    """
+    Bounded per-process LRU in front of Redis for hot payloads. Writers
+    publish the keys they change on CACHE_INVALIDATION_CHANNEL and every
+    process drops them, entries also expire after a short timeout in case a
+    message is lost. Values are shallow copied in and out since callers
+    attach user specific keys to the payloads they get.
+    """
+
+    def __init__(self, max_size=CACHE_LOCAL_SIZE, timeout=CACHE_LOCAL_TIMEOUT):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.start_lock = threading.Lock()
+        self.pid = None
+
+    def start(self):
+        # (Re)start the subscriber thread, it does not survive a fork
+        with self.start_lock:
+            if self.pid == os.getpid():
+                return
+            self.clear()
+            threading.Thread(target=self.listen, daemon=True).start()
+            self.pid = os.getpid()
+
+    def listen(self):
+        while True:
+            try:
+                pubsub = get_redis_connection("default").pubsub(
+                    ignore_subscribe_messages=True
+                )
+                pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+                for message in pubsub.listen():
+                    self.delete_many(json.loads(message["data"]))
+            except Exception:
+                # Invalidations may have been missed while disconnected
+                self.clear()
+                time.sleep(1)
+
+    def get(self, cache_key):
+        if self.pid != os.getpid():
+            self.start()
+        with self.lock:
+            entry = self.entries.get(cache_key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[cache_key]
+                return None
+            self.entries.move_to_end(cache_key)
+        return copy.copy(value)
+
+    def set(self, cache_key, value):
+        if self.pid != os.getpid():
+            self.start()
+        with self.lock:
+            self.entries[cache_key] = (time.monotonic() + self.timeout, copy.copy(value))
+            self.entries.move_to_end(cache_key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete_many(self, cache_keys):
+        with self.lock:
+            for cache_key in cache_keys:
+                self.entries.pop(cache_key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_cache = LocalCache()
+
+
+def invalidate_cache(cache_keys):
+    # Drop the keys from the local tier of every process
+    cache_keys = list(cache_keys)
+    if not cache_keys:
+        return
+    local_cache.delete_many(cache_keys)
+    get_redis_connection("default").publish(
+        CACHE_INVALIDATION_CHANNEL, json.dumps(cache_keys)
+    )
+
+
+def clear_local_cache():
+    local_cache.clear()
+
+
+def get_ttls(cache_keys):
+    # Remaining lifetimes of the keys in one round trip
+    pipeline = get_redis_connection("default").pipeline()
+    for cache_key in cache_keys:
+        pipeline.ttl(cache.make_key(cache_key))
+    return pipeline.execute()
+
+
+def should_refresh_early(ttl):
+    # Probabilistic early expiration (XFetch), more likely as the ttl runs out
+    if ttl is None or ttl < 0:
+        return False
+    draw = -math.log(1 - random.random())
+    return ttl <= CACHE_EARLY_REFRESH_DELTA * CACHE_EARLY_REFRESH_BETA * draw
+
+
+@contextmanager
+def hold_lock(lock_key, timeout, blocking_timeout=None):
+    """
+    Holds a Redis lock around a background job and yields whether it was
+    acquired, waiting only when a blocking_timeout is given. The release is
+    checked against the lock token, so a run that outlived the timeout never
+    frees the lock of the run that took it over.
+    """
+    lock = get_redis_connection("default").lock(lock_key, timeout=timeout)
+    acquired = lock.acquire(
+        blocking=blocking_timeout is not None, blocking_timeout=blocking_timeout
+    )
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            try:
+                lock.release()
+            except LockNotOwnedError:
+                pass
+
+
+def acquire_rebuild_lock(cache_key):
+    return cache.add(
+        CACHE_REBUILD_LOCK_CACHE_KEY(cache_key), 1, CACHE_REBUILD_LOCK_TIMEOUT
+    )
+
+
+def release_rebuild_locks(cache_keys):
+    cache.delete_many([CACHE_REBUILD_LOCK_CACHE_KEY(key) for key in cache_keys])
+
+
+def get_or_rebuild(cache_key, rebuild, is_valid=None, timeout=CACHE_TIMEOUT, local=False):
+    """
+    Single-flight read through cache. rebuild receives the current (stale or
+    incomplete) value, or None when it has to start from scratch, and is only
+    called by the worker holding the rebuild lock of the key. The others keep
+    serving the stale value or wait for the rebuilt one. With local, the
+    value is also kept in the in-process tier.
+    """
+    if is_valid is None:
+        is_valid = lambda value: True  # noqa: E731
+
+    if local:
+        value = local_cache.get(cache_key)
+        if value is not None and is_valid(value):
+            return value
+
+    value = cache.get(cache_key)
+    if value is not None and is_valid(value):
+        if not should_refresh_early(get_ttls([cache_key])[0]):
+            if local:
+                local_cache.set(cache_key, value)
+            return value
+        stale_value, value = value, None
+    else:
+        stale_value = None
+
+    if acquire_rebuild_lock(cache_key):
+        try:
+            value = rebuild(value)
+            cache.set(cache_key, value, timeout)
+            if local:
+                local_cache.set(cache_key, value)
+        finally:
+            release_rebuild_locks([cache_key])
+        return value
+
+    # Another worker is already rebuilding the key
+    if stale_value is not None:
+        return stale_value
+    deadline = time.monotonic() + CACHE_REBUILD_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(CACHE_REBUILD_POLL_INTERVAL)
+        waited_value = cache.get(cache_key)
+        if waited_value is not None and is_valid(waited_value):
+            return waited_value
+
+    # The other rebuild is too slow, serve this request without caching
+    return rebuild(value)
+
+
+def get_many_or_rebuild(cache_keys, rebuild_many, timeout=CACHE_TIMEOUT, local=False):
+    """
+    Single-flight read through cache for several keys at once. cache_keys
+    maps ids to cache keys and rebuild_many maps a list of ids to a dict of
+    id to value. Returns a dict of id to value, missing the ids that could not
+    be rebuilt. With local, the values are also kept in the in-process tier.
+    """
+    local_values = {}
+    if local:
+        for pk, cache_key in cache_keys.items():
+            value = local_cache.get(cache_key)
+            if value is not None:
+                local_values[pk] = value
+        if len(local_values) == len(cache_keys):
+            return local_values
+        cache_keys = {
+            pk: cache_key
+            for pk, cache_key in cache_keys.items()
+            if pk not in local_values
+        }
+
+    cached = cache.get_many(list(cache_keys.values()))
+    values = {pk: cached[key] for pk, key in cache_keys.items() if key in cached}
+    missing_ids = [pk for pk in cache_keys if pk not in values]
+
+    # Refresh the keys close to their expiry before they all miss together
+    refresh_ids = [
+        pk
+        for pk, ttl in zip(values, get_ttls([cache_keys[pk] for pk in values]))
+        if should_refresh_early(ttl)
+    ]
+
+    # Rebuild only the keys this worker holds the lock of
+    owned_ids = [
+        pk for pk in missing_ids + refresh_ids if acquire_rebuild_lock(cache_keys[pk])
+    ]
+    if owned_ids:
+        try:
+            rebuilt = rebuild_many(owned_ids)
+            cache.set_many(
+                {cache_keys[pk]: value for pk, value in rebuilt.items()}, timeout=timeout
+            )
+            values.update(rebuilt)
+        finally:
+            release_rebuild_locks([cache_keys[pk] for pk in owned_ids])
+
+    # Wait for the keys other workers are rebuilding
+    waiting_ids = [pk for pk in missing_ids if pk not in owned_ids]
+    deadline = time.monotonic() + CACHE_REBUILD_WAIT
+    while waiting_ids and time.monotonic() < deadline:
+        time.sleep(CACHE_REBUILD_POLL_INTERVAL)
+        cached = cache.get_many([cache_keys[pk] for pk in waiting_ids])
+        for pk in waiting_ids:
+            if cache_keys[pk] in cached:
+                values[pk] = cached[cache_keys[pk]]
+        waiting_ids = [pk for pk in waiting_ids if pk not in values]
+
+    # The other rebuilds are too slow, serve this request without caching
+    uncached_values = rebuild_many(waiting_ids) if waiting_ids else {}
+
+    if local:
+        for pk, value in values.items():
+            local_cache.set(cache_keys[pk], value)
+    return {**local_values, **values, **uncached_values}
@@ -1,15 +1,16 @@
 from community.constants import (
-    CACHE_TIMEOUT,
     PAGINATOR_SIZE,
     COMMENTS_CACHE_KEY,
-    COMMENTS_LIKE_CACHE_KEY,
 )
 from .database_utils import get_set_temp_name_static_points
-from community.models import ArticleUser, Comment, CommentLike
+from .counter_utils import overlay_comment_counters
+from .status_utils import get_user_statuses, set_user_status
+from .cache_utils import get_or_rebuild, invalidate_cache
+from community.models import Comment
 from .response_serializers import CommentResponseSerializer
-from django.db.models import OuterRef, Subquery, Q
+from .projections import project_comments
+from django.db.models import FilteredRelation, F, Q
 from django.core.cache import cache
-from account.models import User
 from django.db import transaction
 
 def get_paginated_comments(
@@ -25,88 +26,70 @@ def get_paginated_comments(
     cache_key = COMMENTS_CACHE_KEY(
         article_instance.id, parent_comment_instance.id if parent_comment_instance else ""
     )
-    comments_cache = cache.get(cache_key)
-
-    # Initiate the cache if the cache is missing
-    if comments_cache is None:
-        total_comments = (
-            Comment.objects.filter(article=article_instance)
-            .filter(
-                Q(parent_comment=parent_comment_instance)
-                if parent_comment_instance
-                else Q(parent_comment__isnull=True)
-            )
-            .count()
+    comment_queryset = Comment.objects.filter(article=article_instance).filter(
+        Q(parent_comment=parent_comment_instance)
+        if parent_comment_instance
+        else Q(parent_comment__isnull=True)
+    )
+
+    def covers_page(comments_cache):
+        return len(comments_cache["comments"]) >= min(
+            comments_cache["total_comments"], requested_page * PAGINATOR_SIZE
         )
-        comments_cache = {"total_comments": total_comments, "comments": {}}
-        cache.set(cache_key, comments_cache, CACHE_TIMEOUT)
 
-    if comments_cache["total_comments"] == 0:
-        return {
-            "count": comments_cache["total_comments"],
-            "next": None,
-            "results": {"comments": []},
-        }
+    def rebuild(comments_cache):
+        # Initiate the cache if the cache is missing
+        if comments_cache is None:
+            total_comments = comment_queryset.count()
+            comments_cache = {"total_comments": total_comments, "comments": {}}
 
-    # Fetch comments if the cache does not have enough comments
-    if len(comments_cache["comments"]) < requested_page * PAGINATOR_SIZE:
+        # Fetch comments if the cache does not have enough comments
         start_index = len(comments_cache["comments"])
         end_index = min(comments_cache["total_comments"], requested_page * PAGINATOR_SIZE)
-        comment_queryset = (
-            Comment.objects.filter(article=article_instance)
-            .filter(
-                Q(parent_comment=parent_comment_instance)
-                if parent_comment_instance
-                else Q(parent_comment__isnull=True)
-            )
-            .annotate(
-                user_temp_name=Subquery(
-                    ArticleUser.objects.filter(
-                        article=OuterRef("article"), user=OuterRef("user")
-                    ).values("user_temp_name")[:1]
-                ),
-                user_static_points=Subquery(
-                    ArticleUser.objects.filter(
-                        article=OuterRef("article"), user=OuterRef("user")
-                    ).values("user_static_points")[:1]
-                ),
-                user_school=Subquery(
-                    User.objects.filter(id=OuterRef("user")).values("school__initial")[:1]
-                ),
-            )
-            .order_by("-created_at")[start_index:end_index]
-        )
-
-        # Serialize and set the cache
-        new_serialized_comments = CommentResponseSerializer(
-            comment_queryset, many=True
-        ).data
+        if start_index >= end_index:
+            return comments_cache
+        annotated_comment_queryset = annotate_comments(comment_queryset).order_by(
+            "-created_at"
+        )[start_index:end_index]
+
+        # Project the comments straight into response dicts for the cache
+        new_serialized_comments = project_comments(annotated_comment_queryset)
         new_serialized_comments = {
             comment["id"]: comment for comment in new_serialized_comments
         }
         comments_cache["comments"].update(new_serialized_comments)
-        cache.set(cache_key, comments_cache, CACHE_TIMEOUT)
+        return comments_cache
+
+    # Only one worker initiates or extends the cache at a time
+    comments_cache = get_or_rebuild(cache_key, rebuild, covers_page, local=True)
+
+    if comments_cache["total_comments"] == 0:
+        return {
+            "count": comments_cache["total_comments"],
+            "next": None,
+            "results": {"comments": []},
+        }
 
     # Slice the comments that user requested only
     start_index = (requested_page - 1) * 10
     end_index = start_index + PAGINATOR_SIZE
     # print(start_index,end_index)
-    serialized_comments = list(comments_cache["comments"].values())[start_index:end_index]
-
-    # Cache user like status in bulk
-    cache_key = COMMENTS_LIKE_CACHE_KEY(user_instance.id)
-    user_liked_comments = cache.get(cache_key, None)
-    if user_liked_comments is None:
-        user_liked_comments = CommentLike.objects.filter(user=user_instance).values_list(
-            "comment", flat=True
-        )
-        user_liked_comments = {pk: True for pk in user_liked_comments}
-        
-        cache.set(cache_key, user_liked_comments, CACHE_TIMEOUT)
-    
+    serialized_comments = [
+        dict(comment)
+        for comment in list(comments_cache["comments"].values())[start_index:end_index]
+    ]
+
+    # Check the user like status of the page ids only
+    user_liked_comments = get_user_statuses(
+        user_instance.id,
+        [comment["id"] for comment in serialized_comments],
+        ["comment_like_status"],
+    )["comment_like_status"]
+
     # Attach user specific data
     for comment in serialized_comments:
-        comment["like_status"] = user_liked_comments.get(comment["id"], False)
+        comment["like_status"] = user_liked_comments[comment["id"]]
+    overlay_comment_counters(serialized_comments)
 
     # Construct the response data with necessary pagination attributes
     url = request.build_absolute_uri()
@@ -121,6 +104,18 @@ def get_paginated_comments(
         "results": {"comments": serialized_comments},
     }
 
+def annotate_comments(queryset):
+    # Joins instead of per-row subqueries, the author has one ArticleUser per article
+    return queryset.annotate(
+        author=FilteredRelation(
+            "article__articleuser", condition=Q(article__articleuser__user=F("user"))
+        ),
+        user_temp_name=F("author__user_temp_name"),
+        user_static_points=F("author__user_static_points"),
+        user_school=F("user__school__initial"),
+    )
+
+
 def update_comment(comment_instance, updated_fields=None):
     if updated_fields is None:
         updated_fields = {}
@@ -130,20 +125,14 @@ def update_comment(comment_instance, updated_fields=None):
         Comment.objects.filter(id=comment_instance.id).update(**updated_fields)
         comment_instance.refresh_from_db()
 
-    # Cache the comment
+    # Drop the cached page rather than patching it, a rebuild racing the update
+    # could overwrite the patch with the comments it read before the update
     cache_key = COMMENTS_CACHE_KEY(
         comment_instance.article.id,
         comment_instance.parent_comment.id if comment_instance.parent_comment else "",
     )
-    serialized_annotated_comments = cache.get(cache_key, None)
-
-    if serialized_annotated_comments:
-
-        # Update and set the cache
-        serialized_comment = serialized_annotated_comments["comments"][comment_instance.id]
-        for field in updated_fields.keys():
-            serialized_comment[field] = getattr(comment_instance, field)
-        cache.set(cache_key, serialized_annotated_comments)
+    cache.delete(cache_key)
+    invalidate_cache([cache_key])
 
 
 def add_comment(comment_instance, user_instance):
@@ -156,20 +145,13 @@ def add_comment(comment_instance, user_instance):
     comment_instance.user_school = user_instance.school.initial
     serialized_comment = CommentResponseSerializer(comment_instance).data
 
-    # Update the cache
+    # The cached page is rebuilt with the new comment for the same reason
     cache_key = COMMENTS_CACHE_KEY(
         comment_instance.article.id,
         comment_instance.parent_comment.id if comment_instance.parent_comment else "",
     )
-    comments_cache = cache.get(cache_key)
-    if comments_cache:
-        comments_cache["total_comments"] += 1
-
-        # Insert the comment at the beginning of cache
-        comments = {serialized_comment["id"]: serialized_comment}
-        comments.update(comments_cache["comments"])
-        comments_cache["comments"] = comments
-        cache.set(cache_key, comments_cache, CACHE_TIMEOUT)
+    cache.delete(cache_key)
+    invalidate_cache([cache_key])
 
     serialized_comment["like_status"] = False
 
@@ -177,12 +159,6 @@ def add_comment(comment_instance, user_instance):
 
 
 def update_user_liked_comments_cache(comment_instance, user_instance, like_status):
-    
-    # Cache user like status in bulk
-    cache_key = COMMENTS_LIKE_CACHE_KEY(user_instance.id)
-    user_liked_comments = cache.get(cache_key, None)
-    
-    if user_liked_comments:
-        user_liked_comments[comment_instance.id] = like_status
-        cache.set(cache_key, user_liked_comments, CACHE_TIMEOUT)
-    
\ No newline at end of file
+    set_user_status(
+        user_instance.id, comment_instance.id, "comment_like_status", like_status
+    )
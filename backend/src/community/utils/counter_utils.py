@@ -0,0 +1,266 @@
+from community.constants import (
+    ARTICLE_CACHE_KEY,
+    ARTICLE_JSON_CACHE_KEY,
+    COMMENTS_CACHE_KEY,
+    ARTICLE_COUNTERS_CACHE_KEY,
+    COMMENT_COUNTERS_CACHE_KEY,
+    ARTICLE_FLUSHED_COUNTS_CACHE_KEY,
+    COMMENT_FLUSHED_COUNTS_CACHE_KEY,
+    FLUSHED_COUNTS_TIMEOUT,
+    ARTICLE_COUNTERS_DIRTY_CACHE_KEY,
+    COMMENT_COUNTERS_DIRTY_CACHE_KEY,
+    COUNTER_FLUSH_BATCH_SIZE,
+)
+from .database_utils import update_articles_engagement_score
+from django.db.models import F, Case, When, Value
+from django_redis import get_redis_connection
+from community.models import Article, Comment
+from .hot_utils import update_hot_scores
+from .cache_utils import invalidate_cache
+from django.core.cache import cache
+from django.db import transaction
+
+# Move the flushed deltas into the flushed counts in one step, so readers
+# see each of them exactly once. Then drop the hash and its dirty id together
+# once nothing is pending, so an increment during the flush keeps the id
+RELEASE_COUNTERS_SCRIPT = """
+for i = 3, #ARGV, 2 do
+    redis.call("HINCRBY", KEYS[1], ARGV[i], -tonumber(ARGV[i + 1]))
+    redis.call("HINCRBY", KEYS[3], ARGV[i], tonumber(ARGV[i + 1]))
+end
+if #ARGV > 2 then
+    redis.call("EXPIRE", KEYS[3], ARGV[2])
+end
+for _, value in ipairs(redis.call("HVALS", KEYS[1])) do
+    if tonumber(value) ~= 0 then
+        return 0
+    end
+end
+redis.call("DEL", KEYS[1])
+redis.call("SREM", KEYS[2], ARGV[1])
+return 1
+"""
+
+
+def increment_counter(cache_key, dirty_cache_key, pk, field, amount):
+    pipeline = get_redis_connection("default").pipeline()
+    pipeline.hincrby(cache_key(pk), field, amount)
+    pipeline.sadd(dirty_cache_key, pk)
+    pipeline.execute()
+
+
+def increment_article_counter(article_id, field, amount=1):
+    increment_counter(
+        ARTICLE_COUNTERS_CACHE_KEY,
+        ARTICLE_COUNTERS_DIRTY_CACHE_KEY,
+        article_id,
+        field,
+        amount,
+    )
+
+
+def increment_comment_counter(comment_id, field, amount=1):
+    increment_counter(
+        COMMENT_COUNTERS_CACHE_KEY,
+        COMMENT_COUNTERS_DIRTY_CACHE_KEY,
+        comment_id,
+        field,
+        amount,
+    )
+
+
+def get_counter_deltas(cache_key, pks):
+    pipeline = get_redis_connection("default").pipeline(transaction=False)
+    for pk in pks:
+        pipeline.hgetall(cache_key(pk))
+    return {
+        pk: {
+            field.decode(): int(value) for field, value in counters.items() if int(value)
+        }
+        for pk, counters in zip(pks, pipeline.execute())
+    }
+
+
+def get_counter_overlays(cache_key, counts_cache_key, pks):
+    # Read both hashes in one transaction, the release script updates them together
+    pipeline = get_redis_connection("default").pipeline()
+    for pk in pks:
+        pipeline.hgetall(counts_cache_key(pk))
+        pipeline.hgetall(cache_key(pk))
+    results = pipeline.execute()
+    return {
+        pk: (
+            {field.decode(): int(value) for field, value in flushed_counts.items()},
+            {field.decode(): int(value) for field, value in deltas.items()},
+        )
+        for pk, flushed_counts, deltas in zip(pks, results[::2], results[1::2])
+    }
+
+
+def get_article_counter_overlays(article_ids):
+    return get_counter_overlays(
+        ARTICLE_COUNTERS_CACHE_KEY, ARTICLE_FLUSHED_COUNTS_CACHE_KEY, article_ids
+    )
+
+
+def overlay_counts(counts, flushed_counts, deltas):
+    # The flushed counts win, the cached ones may predate the last flush
+    return {
+        field: flushed_counts.get(field, count) + deltas.get(field, 0)
+        for field, count in counts.items()
+    }
+
+
+def overlay_counters(cache_key, counts_cache_key, serialized_instances):
+    # Add the deltas that are not flushed yet so counts look real-time
+    pks = [serialized_instance["id"] for serialized_instance in serialized_instances]
+    overlays = get_counter_overlays(cache_key, counts_cache_key, pks)
+    for serialized_instance in serialized_instances:
+        flushed_counts, deltas = overlays[serialized_instance["id"]]
+        counts = {
+            field: serialized_instance[field] for field in {**flushed_counts, **deltas}
+        }
+        serialized_instance.update(overlay_counts(counts, flushed_counts, deltas))
+    return serialized_instances
+
+
+def overlay_article_counters(serialized_articles):
+    return overlay_counters(
+        ARTICLE_COUNTERS_CACHE_KEY, ARTICLE_FLUSHED_COUNTS_CACHE_KEY, serialized_articles
+    )
+
+
+def overlay_comment_counters(serialized_comments):
+    return overlay_counters(
+        COMMENT_COUNTERS_CACHE_KEY, COMMENT_FLUSHED_COUNTS_CACHE_KEY, serialized_comments
+    )
+
+
+def read_counter_deltas(cache_key, dirty_cache_key, counts_cache_key):
+    # The ids stay dirty until released, a failed flush is retried next time
+    pks = get_redis_connection("default").smembers(dirty_cache_key)
+    deltas = get_counter_deltas(cache_key, [int(pk) for pk in pks])
+
+    # Ids whose deltas cancelled out only need to leave the dirty set
+    release_counter_deltas(
+        cache_key,
+        dirty_cache_key,
+        counts_cache_key,
+        {pk: counters for pk, counters in deltas.items() if not counters},
+    )
+    return {pk: counters for pk, counters in deltas.items() if counters}
+
+
+def publish_flushed_counts(model, counts_cache_key, deltas):
+    # Readers take these over the cached counts until the deltas are released
+    pks = list(deltas)
+    pipeline = get_redis_connection("default").pipeline()
+    for start in range(0, len(pks), COUNTER_FLUSH_BATCH_SIZE):
+        batch = pks[start : start + COUNTER_FLUSH_BATCH_SIZE]  # noqa: E203
+        fields = {field for pk in batch for field in deltas[pk]}
+        for row in model.objects.filter(pk__in=batch).values("id", *fields):
+            pipeline.hset(
+                counts_cache_key(row["id"]),
+                mapping={field: row[field] for field in deltas[row["id"]]},
+            )
+            pipeline.expire(counts_cache_key(row["id"]), FLUSHED_COUNTS_TIMEOUT)
+    pipeline.execute()
+
+
+def apply_counter_deltas(model, deltas):
+    # One UPDATE per counter for a whole batch instead of one per event
+    pks = list(deltas)
+    with transaction.atomic():
+        for start in range(0, len(pks), COUNTER_FLUSH_BATCH_SIZE):
+            batch = pks[start : start + COUNTER_FLUSH_BATCH_SIZE]  # noqa: E203
+            fields = {field for pk in batch for field in deltas[pk]}
+            for field in fields:
+                model.objects.filter(pk__in=batch).update(
+                    **{
+                        field: F(field)
+                        + Case(
+                            *[
+                                When(pk=pk, then=Value(deltas[pk][field]))
+                                for pk in batch
+                                if field in deltas[pk]
+                            ],
+                            default=Value(0),
+                        )
+                    }
+                )
+
+
+def release_counter_deltas(cache_key, dirty_cache_key, counts_cache_key, deltas):
+    # Increments that arrived during the flush stay for the next one
+    release = get_redis_connection("default").register_script(RELEASE_COUNTERS_SCRIPT)
+    for pk, counters in deltas.items():
+        release(
+            keys=[cache_key(pk), dirty_cache_key, counts_cache_key(pk)],
+            args=[pk, FLUSHED_COUNTS_TIMEOUT]
+            + [item for counter in counters.items() for item in counter],
+        )
+
+
+def flush_article_counters():
+    deltas = read_counter_deltas(
+        ARTICLE_COUNTERS_CACHE_KEY,
+        ARTICLE_COUNTERS_DIRTY_CACHE_KEY,
+        ARTICLE_FLUSHED_COUNTS_CACHE_KEY,
+    )
+    if not deltas:
+        return 0
+    publish_flushed_counts(Article, ARTICLE_FLUSHED_COUNTS_CACHE_KEY, deltas)
+    apply_counter_deltas(Article, deltas)
+
+    # Release right after the commit, a failure below must not apply them twice
+    release_counter_deltas(
+        ARTICLE_COUNTERS_CACHE_KEY,
+        ARTICLE_COUNTERS_DIRTY_CACHE_KEY,
+        ARTICLE_FLUSHED_COUNTS_CACHE_KEY,
+        deltas,
+    )
+
+    # Drop the cached articles rather than patching them, a rebuild racing the
+    # flush could overwrite the patch with the counts it read before the update
+    cache_keys = [ARTICLE_CACHE_KEY(pk) for pk in deltas] + [
+        ARTICLE_JSON_CACHE_KEY(pk) for pk in deltas
+    ]
+    cache.delete_many(cache_keys)
+    invalidate_cache(cache_keys)
+
+    # Move the flushed counts into the scores and the hot rankings
+    update_articles_engagement_score(list(deltas))
+    update_hot_scores(Article.objects.select_related("user").filter(pk__in=list(deltas)))
+    return len(deltas)
+
+
+def flush_comment_counters():
+    deltas = read_counter_deltas(
+        COMMENT_COUNTERS_CACHE_KEY,
+        COMMENT_COUNTERS_DIRTY_CACHE_KEY,
+        COMMENT_FLUSHED_COUNTS_CACHE_KEY,
+    )
+    if not deltas:
+        return 0
+    publish_flushed_counts(Comment, COMMENT_FLUSHED_COUNTS_CACHE_KEY, deltas)
+    apply_counter_deltas(Comment, deltas)
+    release_counter_deltas(
+        COMMENT_COUNTERS_CACHE_KEY,
+        COMMENT_COUNTERS_DIRTY_CACHE_KEY,
+        COMMENT_FLUSHED_COUNTS_CACHE_KEY,
+        deltas,
+    )
+
+    # Drop the cached comment pages for the same reason as the articles
+    comments = Comment.objects.filter(pk__in=list(deltas))
+    cache_keys = {
+        COMMENTS_CACHE_KEY(comment.article_id, comment.parent_comment_id or "")
+        for comment in comments
+    }
+    cache.delete_many(cache_keys)
+    invalidate_cache(cache_keys)
+    return len(deltas)
+
+
+def flush_counters():
+    return flush_article_counters() + flush_comment_counters()
@@ -1,11 +1,29 @@
 from community.models import Article, Comment, ArticleUser
-from django.db.models import F, Sum
+from django.db.models import F, Sum, Aggregate, CharField, Value
 from randomname import get_name
 from django.db import transaction
 
 
+class StringAgg(Aggregate):
+    # STRING_AGG on Postgres, GROUP_CONCAT on SQLite where the tests run
+    function = "STRING_AGG"
+    allow_distinct = True
+
+    def __init__(self, expression, delimiter, **extra):
+        super().__init__(expression, Value(delimiter), output_field=CharField(), **extra)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection, function="GROUP_CONCAT", **extra_context
+        )
+
+
 def update_article_engagement_score(article_instance):
-    Article.objects.filter(id=article_instance.id).update(
+    update_articles_engagement_score([article_instance.id])
+
+
+def update_articles_engagement_score(article_ids):
+    Article.objects.filter(id__in=article_ids).update(
         engagement_score=(F("views_count") * 1) + (F("likes_count") * 2) + (F("comments_count") * 3)
     )
 
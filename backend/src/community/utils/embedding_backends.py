@@ -0,0 +1,159 @@
+from community.constants import (
+    EMBEDDING_VECTOR_SIZE,
+    EMBEDDING_VECTOR_MODEL,
+    ENV_OPENAI_API_KEY,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_BATCH_WAIT,
+    EMBEDDING_BATCH_TIMEOUT,
+)
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from django.conf import settings
+from decouple import config
+import numpy as np
+import threading
+import hashlib
+import queue
+import time
+import re
+import os
+
+
+class EmbeddingBackend(ABC):
+    """
+    Turns a list of texts into a (len(texts), EMBEDDING_VECTOR_SIZE) float32
+    array with a single call.
+    """
+
+    model = EMBEDDING_VECTOR_MODEL
+
+    @abstractmethod
+    def embed(self, texts):
+        pass
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+
+    def __init__(self):
+        from openai import OpenAI
+
+        self.client = OpenAI(api_key=config(ENV_OPENAI_API_KEY))
+
+    def embed(self, texts):
+        response = self.client.embeddings.create(input=texts, model=self.model)
+        data = sorted(response.data, key=lambda embedding: embedding.index)
+        return np.array([embedding.embedding for embedding in data], dtype=np.float32)
+
+
+class LocalEmbeddingBackend(EmbeddingBackend):
+    """
+    Deterministic stand-in for tests and benchmarks. Every word is hashed to
+    a signed dimension, so texts sharing words get similar vectors without
+    any network access.
+    """
+
+    model = "local-hashed-words"
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), EMBEDDING_VECTOR_SIZE), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                sign = 1.0 if value & 1 else -1.0
+                vectors[row, (value >> 1) % EMBEDDING_VECTOR_SIZE] += sign
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+EMBEDDING_BACKENDS = {
+    "openai": OpenAIEmbeddingBackend,
+    "local": LocalEmbeddingBackend,
+}
+
+
+class EmbeddingBatcher:
+    """
+    Sends a single text straight to the backend, and lists of texts in calls
+    of up to max_batch_size texts. Threaded callers can instead submit single
+    texts with embed_queued, which coalesces what arrives within max_wait
+    seconds into one backend call. Sync gunicorn workers and prefork Celery
+    workers have no concurrent callers to coalesce, so nothing uses it there.
+    """
+
+    def __init__(
+        self, backend, max_batch_size=EMBEDDING_BATCH_SIZE, max_wait=EMBEDDING_BATCH_WAIT
+    ):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def start(self):
+        # (Re)start the worker thread, it does not survive a fork
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.queue = queue.Queue()
+            threading.Thread(target=self.run, daemon=True).start()
+            self.pid = os.getpid()
+
+    def embed(self, text):
+        return self.backend.embed([text])[0]
+
+    def embed_queued(self, text, timeout=EMBEDDING_BATCH_TIMEOUT):
+        if self.pid != os.getpid():
+            self.start()
+        future = Future()
+        self.queue.put((text, future))
+        return future.result(timeout=timeout)
+
+    def embed_many(self, texts):
+        # Already batched by the caller, only split to respect the batch limit
+        vectors = [
+            self.backend.embed(texts[start : start + self.max_batch_size])  # noqa: E203
+            for start in range(0, len(texts), self.max_batch_size)
+        ]
+        if not vectors:
+            return np.zeros((0, EMBEDDING_VECTOR_SIZE), dtype=np.float32)
+        return np.concatenate(vectors)
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+
+            # Collect whatever else arrives before the deadline
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                vectors = self.backend.embed([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+
+embedding_batcher = None
+embedding_batcher_lock = threading.Lock()
+
+
+def get_embedding_batcher():
+    global embedding_batcher
+    if embedding_batcher is None:
+        with embedding_batcher_lock:
+            if embedding_batcher is None:
+                backend = EMBEDDING_BACKENDS[settings.EMBEDDING_BACKEND]()
+                embedding_batcher = EmbeddingBatcher(backend)
+    return embedding_batcher
@@ -1,58 +1,476 @@
 from community.constants import (
     EMBEDDING_VECTOR_SIZE,
-    EMBEDDING_VECTOR_MODEL,
-    ENV_OPENAI_API_KEY,
+    QUERY_EMBEDDING_CACHE_KEY,
+    QUERY_EMBEDDING_STATS_CACHE_KEY,
+    QUERY_EMBEDDING_CACHE_TIMEOUT,
+    QUERY_EMBEDDING_LRU_SIZE,
+    QUERY_EMBEDDING_STATS_FLUSH_SIZE,
     INDEX_FILE_NAME,
+    PREFERENCE_ALPHA,
+    PREFERENCE_DIRTY_USERS_CACHE_KEY,
+    PREFERENCE_EVENTS_CACHE_KEY,
+    PREFERENCE_FOLD_BATCH_SIZE,
+    FAISS_UNICON_PARTITION,
+    FAISS_SCHOOL_PARTITION,
+    FAISS_DELTA_CACHE_KEY,
+    FAISS_BUILD_BATCH_SIZE,
+    FAISS_INDEX_FACTORIES,
+    FAISS_HNSW_EF_CONSTRUCTION,
+    FAISS_HNSW_EF_SEARCH,
+    FAISS_IVF_NPROBE,
+    FAISS_TRAINING_MIN_SIZE,
+    FAISS_TRAINING_SAMPLE_SIZE,
 )
+from .embedding_backends import get_embedding_batcher
+from django_redis import get_redis_connection
+from django.core.exceptions import ImproperlyConfigured
+from django.core.cache import cache
+from django.conf import settings
 from community.models import Article
-from decouple import config
-from openai import OpenAI
+from account.models import User, School
+from collections import OrderedDict
 import numpy as np
+import threading
+import hashlib
 import faiss
+import os
 
-client = OpenAI(api_key=config(ENV_OPENAI_API_KEY))
+# One delta log entry: the article id followed by its float32 vector
+DELTA_ENTRY_DTYPE = np.dtype([("id", "<i8"), ("vector", "<f4", (EMBEDDING_VECTOR_SIZE,))])
 
+# One preference event: a user opened an article
+PREFERENCE_EVENT_DTYPE = np.dtype([("user_id", "<i8"), ("article_id", "<i8")])
 
-def get_embedding(text, model=EMBEDDING_VECTOR_MODEL):
-    text = text.replace("\n", " ")
-    return client.embeddings.create(input=[text], model=model).data[0].embedding
+# Drop the merged entries only while they are still at the head of the log, a
+# run that merged the same entries may have trimmed them already
+TRIM_FAISS_DELTA_SCRIPT = """
+local size = tonumber(ARGV[1])
+if redis.call("LINDEX", KEYS[1], 0) ~= ARGV[2]
+    or redis.call("LINDEX", KEYS[1], size - 1) ~= ARGV[3] then
+    return 0
+end
+redis.call("LTRIM", KEYS[1], size, -1)
+return 1
+"""
 
 
-def update_preference_vector(user_embeddings, article_embedding, alpha=0.1):
-    user_embeddings = np.array(user_embeddings)
-    article_embedding = np.array(article_embedding)
-    return ((1 - alpha) * user_embeddings + alpha * article_embedding).tolist()
+class FaissIndexManager:
+    """
+    Keeps the FAISS index of one partition resident per worker process and
+    reloads it only when the index file on disk has been replaced by another
+    process.
+    """
 
+    def __init__(self, partition, index_file_name=None):
+        self.partition = partition
+        self.index_file_name = index_file_name or INDEX_FILE_NAME(partition)
+        self.index = None
+        self.version = None
+        self.lock = threading.Lock()
 
-def add_embedding_to_faiss(index, article_embedding, article_id):
-    article_embedding = np.array([article_embedding])
-    article_id = np.array([article_id])
-    index.add_with_ids(article_embedding, article_id)
-    faiss.write_index(index, INDEX_FILE_NAME)
+    def get_version(self):
+        # The (mtime, size) pair changes whenever any worker writes the file
+        try:
+            stat = os.stat(self.index_file_name)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
 
+    def get(self):
+        version = self.get_version()
+        if self.index is not None and version == self.version:
+            return self.index
 
-def search_similar_embeddings(index, embedding, k=100):
-    _, ids = index.search(np.array([embedding]), k=k)
-    return ids[0]
+        with self.lock:
+            # Another thread may have reloaded while we waited for the lock
+            version = self.get_version()
+            if self.index is not None and version == self.version:
+                return self.index
 
+            if version is None:
+                self.index = self.build()
+                self.write(self.index)
+            else:
+                self.index = faiss.read_index(self.index_file_name)
+                set_search_parameters(self.index)
+                self.version = version
 
-def reset_faiss(index):  # This function only for testcases
-    index.reset()
-    for article_instance in Article.objects.all():
-        add_embedding_to_faiss(
-            index, article_instance.embedding_vector, article_instance.id
+        return self.index
+
+    def build(self, index_type=None):
+        ids, vectors = load_article_vectors(self.partition)
+        return build_faiss_index(ids, vectors, index_type or settings.FAISS_INDEX_TYPE)
+
+    def write(self, index):
+        # Write to a temporary file first so readers never see a partial index
+        temp_file_name = f"{self.index_file_name}.{os.getpid()}.tmp"
+        faiss.write_index(index, temp_file_name)
+        os.replace(temp_file_name, self.index_file_name)
+        self.index = index
+        self.version = self.get_version()
+
+
+faiss_index_managers = {}
+
+
+def get_faiss_index_manager(partition):
+    if partition not in faiss_index_managers:
+        faiss_index_managers.setdefault(partition, FaissIndexManager(partition))
+    return faiss_index_managers[partition]
+
+
+def get_faiss_partition(unicon, school_id):
+    # UNI.CON articles are shared by every school, the rest stay in their school
+    return FAISS_UNICON_PARTITION if unicon else FAISS_SCHOOL_PARTITION(school_id)
+
+
+def get_visible_faiss_partitions(school_id):
+    return [FAISS_SCHOOL_PARTITION(school_id), FAISS_UNICON_PARTITION]
+
+
+def get_all_faiss_partitions():
+    school_ids = School.objects.values_list("id", flat=True)
+    return [FAISS_SCHOOL_PARTITION(pk) for pk in school_ids] + [FAISS_UNICON_PARTITION]
+
+
+def get_partition_articles(partition):
+    if partition == FAISS_UNICON_PARTITION:
+        return Article.objects.filter(unicon=True)
+    school_id = int(partition[len(FAISS_SCHOOL_PARTITION("")) :])  # noqa: E203
+    return Article.objects.filter(unicon=False, user__school_id=school_id)
+
+
+def load_article_vectors(partition):
+    ids, vectors = [], []
+    queryset = (
+        get_partition_articles(partition)
+        .filter(embedding_vector__isnull=False)
+        .values_list("id", "embedding_vector")
+        .iterator(chunk_size=FAISS_BUILD_BATCH_SIZE)
+    )
+    for article_id, embedding_vector in queryset:
+        ids.append(article_id)
+        vectors.append(embedding_vector)
+
+    ids = np.array(ids, dtype=np.int64)
+    vectors = np.array(vectors, dtype=np.float32).reshape(-1, EMBEDDING_VECTOR_SIZE)
+    return ids, vectors
+
+
+def create_faiss_index(index_type, training_vectors):
+    if index_type not in FAISS_INDEX_FACTORIES:
+        raise ImproperlyConfigured(
+            f"Unknown FAISS index type {index_type!r}, "
+            f"expected one of {', '.join(FAISS_INDEX_FACTORIES)}."
         )
-    faiss.write_index(index, INDEX_FILE_NAME)
-
-
-def get_faiss_index():
-    try:
-        index = faiss.read_index(INDEX_FILE_NAME)
-    except Exception:
-        index = faiss.IndexFlatL2(EMBEDDING_VECTOR_SIZE)
-        index = faiss.IndexIDMap(index)
-        for article_instance in Article.objects.all():
-            add_embedding_to_faiss(
-                index, article_instance.embedding_vector, article_instance.id
-            )
+
+    # Quantized indexes need enough vectors to train, use exact search until then
+    if index_type == "ivfpq" and len(training_vectors) < FAISS_TRAINING_MIN_SIZE:
+        index_type = "flat"
+
+    index = faiss.index_factory(
+        EMBEDDING_VECTOR_SIZE, FAISS_INDEX_FACTORIES[index_type](len(training_vectors))
+    )
+    sub_index = faiss.downcast_index(index.index)
+    if isinstance(sub_index, faiss.IndexHNSW):
+        sub_index.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+
+    if not index.is_trained:
+        sample_size = min(len(training_vectors), FAISS_TRAINING_SAMPLE_SIZE)
+        sample = np.random.default_rng(0).choice(
+            len(training_vectors), sample_size, replace=False
+        )
+        index.train(training_vectors[np.sort(sample)])
+
     return index
+
+
+def set_search_parameters(index):
+    sub_index = faiss.downcast_index(index.index)
+    if isinstance(sub_index, faiss.IndexHNSW):
+        sub_index.hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+    elif isinstance(sub_index, faiss.IndexIVF):
+        sub_index.nprobe = FAISS_IVF_NPROBE
+
+
+def build_faiss_index(ids, vectors, index_type):
+    index = create_faiss_index(index_type, vectors)
+    for start in range(0, len(ids), FAISS_BUILD_BATCH_SIZE):
+        end = start + FAISS_BUILD_BATCH_SIZE
+        index.add_with_ids(vectors[start:end], ids[start:end])
+    set_search_parameters(index)
+    return index
+
+
+def get_embedding(text):
+    return get_embedding_batcher().embed(text.replace("\n", " "))
+
+
+def get_embeddings(texts):
+    return get_embedding_batcher().embed_many([text.replace("\n", " ") for text in texts])
+
+
+query_embeddings = OrderedDict()
+query_embeddings_lock = threading.Lock()
+
+# Local hits never reach Redis on their own, they are counted in process and
+# written with the next miss, Redis hit or every QUERY_EMBEDDING_STATS_FLUSH_SIZE
+pending_local_hits = 0
+
+
+def normalize_query(text):
+    return " ".join(text.lower().split())
+
+
+def get_query_embedding(text):
+    # Same query with different casing/spacing shares one entry per model
+    model = get_embedding_batcher().backend.model
+    digest = hashlib.sha256(normalize_query(text).encode()).hexdigest()
+    cache_key = QUERY_EMBEDDING_CACHE_KEY(model, digest)
+
+    # In-process LRU first, then Redis, the backend only on a miss in both
+    with query_embeddings_lock:
+        embedding = query_embeddings.get(cache_key)
+        if embedding is not None:
+            query_embeddings.move_to_end(cache_key)
+    if embedding is not None:
+        count_local_hit()
+        return embedding
+
+    cached = cache.get(cache_key)
+    if cached is not None:
+        embedding = np.frombuffer(cached, dtype=np.float32)
+        write_query_embedding_stats("redis_hits")
+    else:
+        embedding = np.asarray(get_embedding(normalize_query(text)), dtype=np.float32)
+        cache.set(cache_key, embedding.tobytes(), QUERY_EMBEDDING_CACHE_TIMEOUT)
+        write_query_embedding_stats("misses")
+
+    with query_embeddings_lock:
+        query_embeddings[cache_key] = embedding
+        query_embeddings.move_to_end(cache_key)
+        while len(query_embeddings) > QUERY_EMBEDDING_LRU_SIZE:
+            query_embeddings.popitem(last=False)
+    return embedding
+
+
+def take_pending_local_hits():
+    global pending_local_hits
+    with query_embeddings_lock:
+        local_hits, pending_local_hits = pending_local_hits, 0
+    return local_hits
+
+
+def count_local_hit():
+    global pending_local_hits
+    with query_embeddings_lock:
+        pending_local_hits += 1
+        flush = pending_local_hits >= QUERY_EMBEDDING_STATS_FLUSH_SIZE
+    if flush:
+        write_query_embedding_stats()
+
+
+def write_query_embedding_stats(field=None):
+    # The pending local hits share the round trip of the request's own counter
+    local_hits = take_pending_local_hits()
+    pipeline = get_redis_connection("default").pipeline(transaction=False)
+    if local_hits:
+        pipeline.hincrby(QUERY_EMBEDDING_STATS_CACHE_KEY, "local_hits", local_hits)
+    if field:
+        pipeline.hincrby(QUERY_EMBEDDING_STATS_CACHE_KEY, field, 1)
+    pipeline.execute()
+
+
+def get_query_embedding_stats():
+    write_query_embedding_stats()
+    counters = get_redis_connection("default").hgetall(QUERY_EMBEDDING_STATS_CACHE_KEY)
+    stats = {
+        field: int(counters.get(field.encode(), 0))
+        for field in ("local_hits", "redis_hits", "misses")
+    }
+    requests = sum(stats.values())
+    stats["hit_rate"] = (stats["local_hits"] + stats["redis_hits"]) / max(1, requests)
+    return stats
+
+
+def update_preference_vector(user_embeddings, article_embedding, alpha=PREFERENCE_ALPHA):
+    user_embeddings = np.asarray(user_embeddings, dtype=np.float32)
+    article_embedding = np.asarray(article_embedding, dtype=np.float32)
+    return (1 - alpha) * user_embeddings + alpha * article_embedding
+
+
+def record_preference_event(user_id, article_id):
+    # Only queue the event, fold_preference_events does the vector math
+    event = np.array([(user_id, article_id)], dtype=PREFERENCE_EVENT_DTYPE)
+    get_redis_connection("default").rpush(PREFERENCE_EVENTS_CACHE_KEY, event.tobytes())
+
+
+def fold_preference_events(alpha=PREFERENCE_ALPHA):
+    redis_connection = get_redis_connection("default")
+    entries = redis_connection.lrange(
+        PREFERENCE_EVENTS_CACHE_KEY, 0, PREFERENCE_FOLD_BATCH_SIZE - 1
+    )
+    if not entries:
+        return 0
+    events = np.frombuffer(b"".join(entries), dtype=PREFERENCE_EVENT_DTYPE)
+
+    # Articles without a vector yet do not move the preference
+    article_vectors = dict(
+        Article.objects.with_vector()
+        .filter(pk__in=set(events["article_id"].tolist()))
+        .filter(embedding_vector__isnull=False)
+        .values_list("id", "embedding_vector")
+    )
+    events = events[np.isin(events["article_id"], list(article_vectors.keys()))]
+
+    if len(events):
+        users = list(
+            User.objects.with_vector().filter(pk__in=set(events["user_id"].tolist()))
+        )
+        user_positions = {user.id: position for position, user in enumerate(users)}
+        events = events[np.isin(events["user_id"], list(user_positions.keys()))]
+
+        # Applying update_preference_vector n times in a row expands to
+        # (1 - alpha)^n * u + sum(alpha * (1 - alpha)^(n - i) * a_i), so the
+        # weight of each event only depends on how many later events it has
+        inverse = np.array([user_positions[pk] for pk in events["user_id"].tolist()])
+        counts = np.bincount(inverse, minlength=len(users))
+        order = np.argsort(inverse, kind="stable")
+        rank = np.empty(len(events), dtype=np.int64)
+        starts = np.cumsum(counts) - counts
+        rank[order] = np.arange(len(events)) - starts[inverse[order]]
+        weights = alpha * (1 - alpha) ** (counts[inverse] - 1 - rank)
+
+        vectors = np.array(
+            [article_vectors[pk] for pk in events["article_id"].tolist()],
+            dtype=np.float32,
+        ).reshape(-1, EMBEDDING_VECTOR_SIZE)
+        blended = np.zeros((len(users), EMBEDDING_VECTOR_SIZE), dtype=np.float64)
+        np.add.at(blended, inverse, weights[:, np.newaxis] * vectors)
+
+        preferences = np.array(
+            [user.embedding_vector for user in users], dtype=np.float64
+        ).reshape(-1, EMBEDDING_VECTOR_SIZE)
+        preferences = (1 - alpha) ** counts[:, np.newaxis] * preferences + blended
+
+        updated_users = []
+        for user, preference, count in zip(users, preferences, counts):
+            if count:
+                user.embedding_vector = preference.astype(np.float32)
+                updated_users.append(user)
+        User.objects.bulk_update(updated_users, ["embedding_vector"])
+
+        # The materialized preference feeds are stale now
+        if updated_users:
+            redis_connection.sadd(
+                PREFERENCE_DIRTY_USERS_CACHE_KEY, *[user.id for user in updated_users]
+            )
+
+    # Only drop the entries that were folded, new ones may have been appended
+    redis_connection.ltrim(PREFERENCE_EVENTS_CACHE_KEY, len(entries), -1)
+    return len(entries)
+
+
+def add_embedding_to_faiss(article_embedding, article_id, partition):
+    # Append to the delta log, the checkpoint task merges it into the index
+    entry = np.zeros(1, dtype=DELTA_ENTRY_DTYPE)
+    entry["id"] = article_id
+    entry["vector"] = article_embedding
+    get_redis_connection("default").rpush(
+        FAISS_DELTA_CACHE_KEY(partition), entry.tobytes()
+    )
+
+
+def get_faiss_delta(partition):
+    entries = get_redis_connection("default").lrange(
+        FAISS_DELTA_CACHE_KEY(partition), 0, -1
+    )
+    return np.frombuffer(b"".join(entries), dtype=DELTA_ENTRY_DTYPE)
+
+
+def search_similar_embeddings(embedding, partitions, k=100):
+    return search_similar_embeddings_batch([embedding], partitions, k)[0]
+
+
+def search_similar_embeddings_batch(embeddings, partitions, k=100):
+    queries = np.asarray(embeddings, dtype=np.float32).reshape(-1, EMBEDDING_VECTOR_SIZE)
+
+    all_distances, all_ids = [], []
+    for partition in partitions:
+        # Read the delta before the index, so a checkpoint landing in between
+        # can only produce duplicates and never hide an article
+        delta = get_faiss_delta(partition)
+        distances, ids = get_faiss_index(partition).search(queries, k=k)
+        all_distances.append(distances)
+        all_ids.append(ids)
+
+        if len(delta):
+            # Squared L2 distance of every query to every delta vector
+            vectors = delta["vector"]
+            all_distances.append(
+                (queries**2).sum(axis=1)[:, np.newaxis]
+                - 2 * queries @ vectors.T
+                + (vectors**2).sum(axis=1)[np.newaxis, :]
+            )
+            all_ids.append(np.broadcast_to(delta["id"], (len(queries), len(delta))))
+
+    # Merge the result lists by distance and drop the empty/duplicate slots
+    rankings = []
+    for distances, ids in zip(
+        np.concatenate(all_distances, axis=1), np.concatenate(all_ids, axis=1)
+    ):
+        ids = ids[np.argsort(distances, kind="stable")]
+        ids = ids[ids != -1]
+        _, first_positions = np.unique(ids, return_index=True)
+        rankings.append(ids[np.sort(first_positions)][:k])
+    return rankings
+
+
+def checkpoint_faiss_index(partition):
+    redis_connection = get_redis_connection("default")
+    entries = redis_connection.lrange(FAISS_DELTA_CACHE_KEY(partition), 0, -1)
+    if not entries:
+        return 0
+    delta = np.frombuffer(b"".join(entries), dtype=DELTA_ENTRY_DTYPE)
+
+    # Merge the delta into a copy of the resident index and publish it. An
+    # article's vector never changes, so ids already in the index are skipped
+    # instead of removed (HNSW does not support removal)
+    manager = get_faiss_index_manager(partition)
+    index = faiss.clone_index(manager.get())
+    set_search_parameters(index)
+    delta_ids, positions = np.unique(delta["id"], return_index=True)
+    new = ~np.isin(delta_ids, faiss.vector_to_array(index.id_map))
+    if new.any():
+        vectors = np.ascontiguousarray(delta["vector"][positions[new]])
+        index.add_with_ids(vectors, delta_ids[new])
+        manager.write(index)
+
+    # Only drop the entries that were merged, new ones may have been appended
+    trim_faiss_delta(partition, entries)
+    return len(entries)
+
+
+def trim_faiss_delta(partition, entries):
+    trim = get_redis_connection("default").register_script(TRIM_FAISS_DELTA_SCRIPT)
+    return trim(
+        keys=[FAISS_DELTA_CACHE_KEY(partition)],
+        args=[len(entries), entries[0], entries[-1]],
+    )
+
+
+def reset_faiss():  # This function only for testcases
+    redis_connection = get_redis_connection("default")
+    for partition in get_all_faiss_partitions():
+        redis_connection.delete(FAISS_DELTA_CACHE_KEY(partition))
+        manager = get_faiss_index_manager(partition)
+        manager.write(manager.build())
+    redis_connection.delete(QUERY_EMBEDDING_STATS_CACHE_KEY)
+    redis_connection.delete(PREFERENCE_EVENTS_CACHE_KEY)
+    redis_connection.delete(PREFERENCE_DIRTY_USERS_CACHE_KEY)
+    query_embeddings.clear()
+    take_pending_local_hits()
+
+
+def get_faiss_index(partition):
+    return get_faiss_index_manager(partition).get()
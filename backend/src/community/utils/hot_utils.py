@@ -0,0 +1,124 @@
+from community.constants import (
+    HOT_ARTICLES_CACHE_KEY,
+    HOT_ARTICLES_BUILT_MEMBER,
+    HOT_GRAVITY,
+    HOT_WINDOW,
+)
+from django_redis import get_redis_connection
+from community.models import Article
+from account.models import School
+from django.utils import timezone
+from django.db.models import Q
+from datetime import timedelta
+
+
+def get_hot_score(views_count, likes_count, comments_count, created_at, now):
+    # Same weights as the engagement score, divided by a power of the age
+    engagement = views_count + likes_count * 2 + comments_count * 3
+    age_hours = max(0, (now - created_at).total_seconds() / 3600)
+    return (engagement + 1) / (age_hours + 2) ** HOT_GRAVITY
+
+
+def rebuild_hot_rankings(school_ids=None):
+    if school_ids is None:
+        school_ids = list(School.objects.values_list("id", flat=True))
+
+    # Articles past the window have decayed out of the ranking
+    now = timezone.now()
+    articles = (
+        Article.objects.filter(created_at__gte=now - timedelta(seconds=HOT_WINDOW))
+        .filter(Q(unicon=True) | Q(user__school_id__in=school_ids))
+        .values_list(
+            "id",
+            "unicon",
+            "user__school_id",
+            "views_count",
+            "likes_count",
+            "comments_count",
+            "created_at",
+        )
+    )
+    unicon_scores, school_scores = {}, {school_id: {} for school_id in school_ids}
+    for pk, unicon, school_id, views, likes, comments, created_at in articles:
+        scores = unicon_scores if unicon else school_scores[school_id]
+        scores[pk] = get_hot_score(views, likes, comments, created_at, now)
+
+    # UNI.CON articles are fanned out to every school, swapped in one MULTI. The
+    # built member ranks last, Redis would not keep a ranking without articles
+    pipeline = get_redis_connection("default").pipeline()
+    for school_id in school_ids:
+        cache_key = HOT_ARTICLES_CACHE_KEY(school_id)
+        pipeline.delete(cache_key)
+        scores = {**school_scores[school_id], **unicon_scores}
+        pipeline.zadd(cache_key, {**scores, HOT_ARTICLES_BUILT_MEMBER: float("-inf")})
+    pipeline.execute()
+    return len(school_ids)
+
+
+def update_hot_score(article_instance):
+    update_hot_scores([article_instance])
+
+
+def update_hot_scores(article_instances):
+    # Articles past the window stay out, as they would after the next rebuild
+    now = timezone.now()
+    article_instances = [
+        article_instance
+        for article_instance in article_instances
+        if article_instance.created_at >= now - timedelta(seconds=HOT_WINDOW)
+    ]
+    if not article_instances:
+        return
+
+    # Every UNI.CON article of the batch goes to the same schools, read them once
+    all_school_ids = []
+    if any(article_instance.unicon for article_instance in article_instances):
+        all_school_ids = list(School.objects.values_list("id", flat=True))
+
+    scores = {}
+    for article_instance in article_instances:
+        score = get_hot_score(
+            article_instance.views_count,
+            article_instance.likes_count,
+            article_instance.comments_count,
+            article_instance.created_at,
+            now,
+        )
+        if article_instance.unicon:
+            school_ids = all_school_ids
+        else:
+            school_ids = [article_instance.user.school_id]
+        for school_id in school_ids:
+            cache_key = HOT_ARTICLES_CACHE_KEY(school_id)
+            scores.setdefault(cache_key, {})[article_instance.id] = score
+
+    # Rankings that are not built yet get the articles on their rebuild
+    redis_connection = get_redis_connection("default")
+    cache_keys = list(scores)
+    pipeline = redis_connection.pipeline(transaction=False)
+    for cache_key in cache_keys:
+        pipeline.exists(cache_key)
+    built = pipeline.execute()
+
+    pipeline = redis_connection.pipeline(transaction=False)
+    for cache_key, exists in zip(cache_keys, built):
+        if exists:
+            pipeline.zadd(cache_key, scores[cache_key])
+    pipeline.execute()
+
+
+def get_hot_article_ids(school_id, start_index, end_index):
+    redis_connection = get_redis_connection("default")
+    cache_key = HOT_ARTICLES_CACHE_KEY(school_id)
+    if not redis_connection.exists(cache_key):
+        rebuild_hot_rankings([school_id])
+
+    pipeline = redis_connection.pipeline()
+    pipeline.zrevrange(cache_key, start_index, end_index - 1)
+    pipeline.zcard(cache_key)
+    article_ids, articles_count = pipeline.execute()
+
+    # The built member is not an article, leave it out of the page and the count
+    article_ids = [pk.decode() for pk in article_ids]
+    article_ids = [int(pk) for pk in article_ids if pk != HOT_ARTICLES_BUILT_MEMBER]
+    return article_ids, articles_count - 1
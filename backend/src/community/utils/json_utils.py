@@ -0,0 +1,40 @@
+from django.http import HttpResponse
+import orjson
+
+
+class JSONBytesResponse(HttpResponse):
+    """
+    Response for a body that is already encoded as JSON, it skips the DRF
+    renderer. data decodes the body for callers expecting a DRF Response.
+    """
+
+    def __init__(self, content, status=200):
+        super().__init__(content, status=status, content_type="application/json")
+
+    @property
+    def data(self):
+        return orjson.loads(self.content)
+
+
+def encode_shared_json(serialized_instance, spliced_fields):
+    # Leave the object open so the per-request fields can be appended
+    return orjson.dumps(
+        {
+            field: value
+            for field, value in serialized_instance.items()
+            if field not in spliced_fields
+        }
+    )[:-1]
+
+
+def splice_json(shared_json, fields):
+    return shared_json + b"," + orjson.dumps(fields)[1:]
+
+
+def encode_page(next_page, results_name, encoded_items, count=None):
+    # Assemble the paginated response around the encoded items
+    pagination = {"next": next_page}
+    if count is not None:
+        pagination = {"count": count, "next": next_page}
+    results = b'{"%s":[%s]}' % (results_name.encode(), b",".join(encoded_items))
+    return orjson.dumps(pagination)[:-1] + b',"results":' + results + b"}"
@@ -6,7 +6,7 @@ from community.constants import (
 )
 from community.task import send_email
 from django.db.models import OuterRef, Subquery, Case, When, Value, F
-from .response_serializers import NotificationResponseSerializer
+from .projections import project_notifications
 from community.models import  Notification, Article, Comment
 from django.contrib.contenttypes.models import ContentType
 from django.db.models.functions import Coalesce
@@ -48,41 +48,26 @@ def get_paginated_new_notifications(request):
     start_index = (requested_page - 1) * PAGINATOR_SIZE
     end_index = requested_page * PAGINATOR_SIZE
     
-    notification_queryset = (
-        Notification.objects.filter(user=user_instance, read=False).annotate(
-            content=Coalesce(
-                Case(
-                    # If content_type is "article", get the title from Article
-                    When(
-                        content_type__model="article",
-                        then=Subquery(Article.objects.filter(id=OuterRef("object_id")).values("title")[:1])
-                    ),
-                    # If content_type is "comment", get the body from Comment
-                    When(
-                        content_type__model="comment",
-                        then=Subquery(Comment.objects.filter(id=OuterRef("object_id")).values("body")[:1])
-                    ),
-                    default=Value("Unknown"),  # Default value if no match
-                    output_field=models.CharField(),
-                ),
-                Value("Unknown") 
-            ),
-            type_name=F("content_type__model")
-        ).order_by("-created_at")[start_index:end_index]
-    )
-
-    read_notification_ids = list(notification_queryset.values_list('id', flat=True))
+    notification_queryset = annotate_notifications(
+        Notification.objects.filter(user=user_instance, read=False)
+    ).order_by("-created_at")[start_index:end_index]
+
+    # Project the page before it is marked as read and drops out of the queryset
+    serialized_notifications = project_notifications(notification_queryset)
+    read_notification_ids = [
+        notification["id"] for notification in serialized_notifications
+    ]
     with transaction.atomic():
         Notification.objects.filter(id__in=read_notification_ids).update(read=True)
 
-    notifications_cache["total_notifications"] += len(notification_queryset)
-    notifications_cache["unaware_notifications"] = [nid for nid in notifications_cache["unaware_notifications"] if nid not in read_notification_ids]
+    notifications_cache["total_notifications"] += len(serialized_notifications)
+    notifications_cache["unaware_notifications"] = [
+        nid
+        for nid in notifications_cache["unaware_notifications"]
+        if nid not in read_notification_ids
+    ]
     cache.set(cache_key, notifications_cache, CACHE_TIMEOUT)
 
-    serialized_notifications = NotificationResponseSerializer(
-        notification_queryset, many=True
-    ).data
-
     # Construct the response data with necessary pagination attributes
     url = request.build_absolute_uri()
     if end_index < total_notifications:
@@ -132,34 +117,18 @@ def get_paginated_read_notifications(request):
     if len(notifications_cache["notifications"]) < requested_page * PAGINATOR_SIZE:
         start_index = len(notifications_cache["notifications"])
         end_index = requested_page * PAGINATOR_SIZE
-        notification_queryset = (
-            Notification.objects.filter(user=user_instance, read=True).annotate(
-                content=Coalesce(
-                    Case(
-                        # If content_type is "article", get the title from Article
-                        When(
-                            content_type__model="article",
-                            then=Subquery(Article.objects.filter(id=OuterRef("object_id")).values("title")[:1])
-                        ),
-                        # If content_type is "comment", get the body from Comment
-                        When(
-                            content_type__model="comment",
-                            then=Subquery(Comment.objects.filter(id=OuterRef("object_id")).values("body")[:1])
-                        ),
-                        default=Value("Unknown"),  # Default value if no match
-                        output_field=models.CharField(),
-                    ),
-                    Value("Unknown") 
-                ),
-                type_name=F("content_type__model")
-            ).order_by("-created_at")[start_index:end_index]
-        )
+        notification_queryset = annotate_notifications(
+            Notification.objects.filter(user=user_instance, read=True)
+        ).order_by("-created_at")[start_index:end_index]
 
-        # Serialize and update the cache with the new notifications
-        new_serialized_notifications = NotificationResponseSerializer(
-            notification_queryset, many=True
-        ).data
-        notifications_cache["notifications"].update(new_serialized_notifications)
+        # Project and update the cache with the new notifications
+        new_serialized_notifications = project_notifications(notification_queryset)
+        notifications_cache["notifications"].update(
+            {
+                notification["id"]: notification
+                for notification in new_serialized_notifications
+            }
+        )
     
     cache.set(cache_key, notifications_cache, CACHE_TIMEOUT)
 
@@ -182,6 +151,37 @@ def get_paginated_read_notifications(request):
     }
 
 
+def annotate_notifications(queryset):
+    return queryset.annotate(
+        content=Coalesce(
+            Case(
+                # If content_type is "article", get the title from Article
+                When(
+                    content_type__model="article",
+                    then=Subquery(
+                        Article.objects.filter(id=OuterRef("object_id")).values(
+                            "title"
+                        )[:1]
+                    ),
+                ),
+                # If content_type is "comment", get the body from Comment
+                When(
+                    content_type__model="comment",
+                    then=Subquery(
+                        Comment.objects.filter(id=OuterRef("object_id")).values(
+                            "body"
+                        )[:1]
+                    ),
+                ),
+                default=Value("Unknown"),  # Default value if no match
+                output_field=models.CharField(),
+            ),
+            Value("Unknown")
+        ),
+        type_name=F("content_type__model")
+    )
+
+
 def add_notification(notification_type, user_instance, model_class, object_id):
 
     # Create the notification in the database
@@ -0,0 +1,95 @@
+from community.constants import (
+    PREFERENCE_DIRTY_USERS_CACHE_KEY,
+    PREFERENCE_NEW_ARTICLES_CACHE_KEY,
+    PREFERENCE_ACTIVE_USERS_CACHE_KEY,
+    PREFERENCE_ACTIVE_WINDOW,
+    PREFERENCE_FEED_CACHE_KEY,
+    PREFERENCE_FEED_SIZE,
+    PREFERENCE_FEED_MAX_AGE,
+)
+from .embedding_utils import search_similar_embeddings_batch, get_visible_faiss_partitions
+from django_redis import get_redis_connection
+from account.models import User
+import numpy as np
+import time
+
+
+def materialize_preference_feeds(user_ids):
+    users = list(User.objects.with_vector().filter(pk__in=user_ids))
+    users_by_school = {}
+    for user in users:
+        users_by_school.setdefault(user.school_id, []).append(user)
+
+    # One FAISS search per school for all of its users
+    pipeline = get_redis_connection("default").pipeline()
+    for school_id, school_users in users_by_school.items():
+        rankings = search_similar_embeddings_batch(
+            [user.embedding_vector for user in school_users],
+            get_visible_faiss_partitions(school_id),
+            PREFERENCE_FEED_SIZE,
+        )
+        for user, ranking in zip(school_users, rankings):
+            cache_key = PREFERENCE_FEED_CACHE_KEY(user.id)
+            pipeline.hset(
+                cache_key,
+                mapping={
+                    "article_ids": ranking.astype(np.int64).tobytes(),
+                    "computed_at": time.time(),
+                },
+            )
+            pipeline.expire(cache_key, PREFERENCE_ACTIVE_WINDOW)
+    pipeline.execute()
+    return len(users)
+
+
+def refresh_preference_feeds():
+    redis_connection = get_redis_connection("default")
+
+    # Users who have not opened the feed for a while are dropped
+    redis_connection.zremrangebyscore(
+        PREFERENCE_ACTIVE_USERS_CACHE_KEY, 0, time.time() - PREFERENCE_ACTIVE_WINDOW
+    )
+    active_user_ids = {
+        int(pk)
+        for pk in redis_connection.zrange(PREFERENCE_ACTIVE_USERS_CACHE_KEY, 0, -1)
+    }
+
+    # New articles can enter anyone's feed, a new vector only the user's own
+    dirty_user_ids = {
+        int(pk)
+        for pk in redis_connection.spop(
+            PREFERENCE_DIRTY_USERS_CACHE_KEY,
+            redis_connection.scard(PREFERENCE_DIRTY_USERS_CACHE_KEY),
+        )
+        or []
+    }
+    if redis_connection.getdel(PREFERENCE_NEW_ARTICLES_CACHE_KEY):
+        user_ids = active_user_ids
+    else:
+        user_ids = dirty_user_ids & active_user_ids
+
+    # Inactive users rebuild their feed on the next visit instead
+    inactive_user_ids = dirty_user_ids - active_user_ids
+    if inactive_user_ids:
+        redis_connection.delete(*map(PREFERENCE_FEED_CACHE_KEY, inactive_user_ids))
+
+    if not user_ids:
+        return 0
+    return materialize_preference_feeds(user_ids)
+
+
+def get_preference_feed(user_id):
+    redis_connection = get_redis_connection("default")
+    redis_connection.zadd(PREFERENCE_ACTIVE_USERS_CACHE_KEY, {user_id: time.time()})
+
+    # Materialize inline only when the background job has not kept up
+    feed = redis_connection.hgetall(PREFERENCE_FEED_CACHE_KEY(user_id))
+    if not feed or time.time() - float(feed[b"computed_at"]) > PREFERENCE_FEED_MAX_AGE:
+        materialize_preference_feeds([user_id])
+        feed = redis_connection.hgetall(PREFERENCE_FEED_CACHE_KEY(user_id))
+
+    return np.frombuffer(feed[b"article_ids"], dtype=np.int64).tolist()
+
+
+def mark_new_preference_articles():
+    get_redis_connection("default").set(PREFERENCE_NEW_ARTICLES_CACHE_KEY, 1)
@@ -0,0 +1,107 @@
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .database_utils import StringAgg
+
+
+def format_datetime(value):
+    # Same output as the DRF DateTimeField with the default ISO 8601 format
+    value = timezone.localtime(value).isoformat()
+    if value.endswith("+00:00"):
+        value = value[:-6] + "Z"
+    return value
+
+
+def compile_projection(fields, aggregates=None):
+    """
+    fields maps each output key to a values() name, or to a (name, converter)
+    pair for the values that need formatting. Returns a function mapping a
+    queryset straight to the dicts the response serializer would output,
+    without instantiating it.
+
+    aggregates are annotated after values(), so the rows are grouped by the
+    projected columns only rather than by every column of the model.
+    """
+    columns = [
+        (key, field) if isinstance(field, tuple) else (key, (field, None))
+        for key, field in fields.items()
+    ]
+    names = [name for _, (name, _) in columns]
+    converters = [(key, converter) for key, (_, converter) in columns]
+    aggregates = aggregates or {}
+    grouped_names = [name for name in names if name not in aggregates]
+
+    def project(queryset):
+        if aggregates:
+            queryset = queryset.values(*grouped_names).annotate(**aggregates)
+        return [
+            {
+                key: value if converter is None or value is None else converter(value)
+                for (key, converter), value in zip(converters, row)
+            }
+            for row in queryset.values_list(*names)
+        ]
+
+    return project
+
+
+# Every course code of the article, joined in the same query as the article
+ARTICLE_AGGREGATES = {
+    "course_code": Coalesce(StringAgg("articlecourse__course__code", ","), Value("")),
+}
+
+# Same keys and order as ArticleResponseSerializer, without the user statuses
+project_articles = compile_projection(
+    {
+        "id": "id",
+        "user": "user",
+        "created_at": ("created_at", format_datetime),
+        "views_count": "views_count",
+        "comments_count": "comments_count",
+        "likes_count": "likes_count",
+        "deleted": "deleted",
+        "edited": "edited",
+        "title": "title",
+        "body": "body",
+        "unicon": "unicon",
+        "user_school": "user_school",
+        "user_static_points": "user_static_points",
+        "user_temp_name": "user_temp_name",
+        "course_code": "course_code",
+    },
+    ARTICLE_AGGREGATES,
+)
+
+# Same keys and order as CommentResponseSerializer, without the like status
+project_comments = compile_projection(
+    {
+        "id": "id",
+        "user": "user",
+        "created_at": ("created_at", format_datetime),
+        "comments_count": "comments_count",
+        "likes_count": "likes_count",
+        "deleted": "deleted",
+        "edited": "edited",
+        "body": "body",
+        "article": "article",
+        "parent_comment": "parent_comment",
+        "user_school": "user_school",
+        "user_temp_name": "user_temp_name",
+        "user_static_points": "user_static_points",
+    }
+)
+
+# Same keys and order as NotificationResponseSerializer
+project_notifications = compile_projection(
+    {
+        "id": "id",
+        "group": "group",
+        "user": "user",
+        "object_id": "object_id",
+        "read": "read",
+        "email": "email",
+        "created_at": ("created_at", format_datetime),
+        "content": "content",
+        "type_name": "type_name",
+    }
+)
@@ -0,0 +1,91 @@
+from community.constants import (
+    SEARCH_CONFIG,
+    SEARCH_KEYWORD_MAX_TERMS,
+    SEARCH_RRF_K,
+)
+from django.contrib.postgres.search import (
+    SearchVector,
+    SearchQuery,
+    SearchRank,
+)
+from .embedding_utils import get_query_embedding, search_similar_embeddings
+from community.models import Article, ArticleCourse
+from django.db.models import F, Q, Value
+from django.db import connection
+
+
+def update_article_search_vector(article_id):
+    # Only Postgres has tsvector, other databases search with icontains
+    if connection.vendor != "postgresql":
+        return
+
+    course_codes = " ".join(
+        ArticleCourse.objects.filter(article=article_id).values_list(
+            "course__code", flat=True
+        )
+    )
+    Article.objects.filter(pk=article_id).update(
+        search_vector=(
+            SearchVector("title", weight="A", config=SEARCH_CONFIG)
+            + SearchVector(Value(course_codes), weight="A", config=SEARCH_CONFIG)
+            + SearchVector("body", weight="B", config=SEARCH_CONFIG)
+        )
+    )
+
+
+def search_lexical_article_ids(queryset, search_content, k):
+    # Like the vector search, articles still waiting for an embedding are left out
+    queryset = queryset.filter(embedding_vector__isnull=False)
+
+    if connection.vendor == "postgresql":
+        query = SearchQuery(search_content, search_type="websearch", config=SEARCH_CONFIG)
+        return list(
+            queryset.filter(search_vector=query)
+            .annotate(rank=SearchRank(F("search_vector"), query))
+            .order_by("-rank", "-id")
+            .values_list("id", flat=True)[:k]
+        )
+
+    # Every term has to appear in the title, the body or a course code
+    condition = Q()
+    for term in search_content.split():
+        condition &= (
+            Q(title__icontains=term)
+            | Q(body__icontains=term)
+            | Q(articlecourse__course__code__iexact=term)
+        )
+    return list(
+        queryset.filter(condition)
+        .distinct()
+        .order_by("-created_at", "-id")
+        .values_list("id", flat=True)[:k]
+    )
+
+
+def search_vector_article_ids(search_content, partitions, k):
+    return [
+        int(pk)
+        for pk in search_similar_embeddings(
+            get_query_embedding(search_content), partitions, k
+        )
+    ]
+
+
+def fuse_rankings(rankings, k):
+    # Reciprocal rank fusion, ids ranked high in either list come first
+    scores = {}
+    for ranking in rankings:
+        for position, pk in enumerate(ranking):
+            scores[pk] = scores.get(pk, 0) + 1 / (SEARCH_RRF_K + position + 1)
+    return sorted(scores, key=lambda pk: scores[pk], reverse=True)[:k]
+
+
+def search_hybrid_article_ids(queryset, search_content, partitions, k):
+    lexical_ids = search_lexical_article_ids(queryset, search_content, k)
+
+    # Short keyword queries (course codes, title words) skip the embedder
+    if lexical_ids and len(search_content.split()) <= SEARCH_KEYWORD_MAX_TERMS:
+        return lexical_ids
+
+    vector_ids = search_vector_article_ids(search_content, partitions, k)
+    return fuse_rankings([lexical_ids, vector_ids], k)
@@ -0,0 +1,62 @@
+from community.constants import (
+    CACHE_TIMEOUT,
+    ARTICLES_LIKE_CACHE_KEY,
+    ARTICLES_VIEW_CACHE_KEY,
+    ARTICLES_SAVE_CACHE_KEY,
+    COMMENTS_LIKE_CACHE_KEY,
+)
+from community.models import ArticleLike, ArticleView, ArticleSave, CommentLike
+from django_redis import get_redis_connection
+
+# Status name: (cache key, model, related field) of a per-user set of ids
+USER_STATUS_SETS = {
+    "like_status": (ARTICLES_LIKE_CACHE_KEY, ArticleLike, "article"),
+    "view_status": (ARTICLES_VIEW_CACHE_KEY, ArticleView, "article"),
+    "save_status": (ARTICLES_SAVE_CACHE_KEY, ArticleSave, "article"),
+    "comment_like_status": (COMMENTS_LIKE_CACHE_KEY, CommentLike, "comment"),
+}
+
+
+def seed_user_status_sets(user_id, statuses):
+    redis_connection = get_redis_connection("default")
+    cache_keys = [USER_STATUS_SETS[status][0](user_id) for status in statuses]
+    pipeline = redis_connection.pipeline(transaction=False)
+    for cache_key in cache_keys:
+        pipeline.exists(cache_key)
+    seeded = pipeline.execute()
+
+    # Load the missing sets from the database once, 0 marks a set as seeded
+    pipeline = redis_connection.pipeline(transaction=False)
+    for status, cache_key, exists in zip(statuses, cache_keys, seeded):
+        if exists:
+            continue
+        _, model, field = USER_STATUS_SETS[status]
+        pks = model.objects.filter(user=user_id).values_list(field, flat=True)
+        pipeline.sadd(cache_key, 0, *pks)
+        pipeline.expire(cache_key, CACHE_TIMEOUT)
+    pipeline.execute()
+
+
+def get_user_statuses(user_id, pks, statuses):
+    if not pks:
+        return {status: {} for status in statuses}
+
+    # Only the ids on the page are checked, whatever the user's history
+    seed_user_status_sets(user_id, statuses)
+    pipeline = get_redis_connection("default").pipeline(transaction=False)
+    for status in statuses:
+        pipeline.smismember(USER_STATUS_SETS[status][0](user_id), pks)
+    return {
+        status: dict(zip(pks, map(bool, members)))
+        for status, members in zip(statuses, pipeline.execute())
+    }
+
+
+def set_user_status(user_id, pk, status, value):
+    seed_user_status_sets(user_id, [status])
+    cache_key = USER_STATUS_SETS[status][0](user_id)
+    redis_connection = get_redis_connection("default")
+    if value:
+        redis_connection.sadd(cache_key, pk)
+    else:
+        redis_connection.srem(cache_key, pk)
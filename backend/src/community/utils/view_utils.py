@@ -0,0 +1,69 @@
+from community.constants import (
+    CACHE_TIMEOUT,
+    ARTICLE_VIEWERS_CACHE_KEY,
+    ARTICLE_VIEWS_PENDING_CACHE_KEY,
+    ARTICLE_VIEWS_FLUSH_BATCH_SIZE,
+)
+from .counter_utils import increment_article_counter
+from django_redis import get_redis_connection
+from community.models import ArticleView
+from django.conf import settings
+import numpy as np
+
+# One pending ArticleView row
+VIEW_EVENT_DTYPE = np.dtype([("user_id", "<i8"), ("article_id", "<i8")])
+
+
+def add_article_viewer(article_id, user_id):
+    redis_connection = get_redis_connection("default")
+    cache_key = ARTICLE_VIEWERS_CACHE_KEY(article_id)
+
+    # Seed the set from the database once, 0 marks it as seeded
+    if not redis_connection.exists(cache_key):
+        viewer_ids = ArticleView.objects.filter(article=article_id).values_list(
+            "user", flat=True
+        )
+        pipeline = redis_connection.pipeline()
+        pipeline.sadd(cache_key, 0, *viewer_ids)
+        pipeline.expire(cache_key, CACHE_TIMEOUT)
+        pipeline.execute()
+
+    return bool(redis_connection.sadd(cache_key, user_id))
+
+
+def record_article_view(user_id, article_id):
+    first_view = add_article_viewer(article_id, user_id)
+
+    # Only a first view needs a row, the flush inserts it in a batch
+    if first_view:
+        event = np.array([(user_id, article_id)], dtype=VIEW_EVENT_DTYPE)
+        get_redis_connection("default").rpush(
+            ARTICLE_VIEWS_PENDING_CACHE_KEY, event.tobytes()
+        )
+
+    if first_view or not settings.UNIQUE_ARTICLE_VIEWS:
+        increment_article_counter(article_id, "views_count")
+    return first_view
+
+
+def flush_article_views():
+    redis_connection = get_redis_connection("default")
+    entries = redis_connection.lrange(
+        ARTICLE_VIEWS_PENDING_CACHE_KEY, 0, ARTICLE_VIEWS_FLUSH_BATCH_SIZE - 1
+    )
+    if not entries:
+        return 0
+    events = np.frombuffer(b"".join(entries), dtype=VIEW_EVENT_DTYPE)
+
+    # Rows that already exist (e.g. after a Redis restart) are skipped
+    ArticleView.objects.bulk_create(
+        [
+            ArticleView(user_id=user_id, article_id=article_id)
+            for user_id, article_id in events.tolist()
+        ],
+        ignore_conflicts=True,
+    )
+
+    # Only drop the entries that were inserted, new ones may have been appended
+    redis_connection.ltrim(ARTICLE_VIEWS_PENDING_CACHE_KEY, len(entries), -1)
+    return len(entries)
@@ -4,12 +4,22 @@ from community.utils import (
     update_user_viewed_article_cache,
     update_user_saved_article_cache,
     update_user_liked_article_cache,
-    search_similar_embeddings,
-    update_preference_vector,
-    add_embedding_to_faiss,
-    get_faiss_index,
-    get_embedding,
+    record_preference_event,
+    get_visible_faiss_partitions,
+    update_article_search_vector,
+    search_lexical_article_ids,
+    search_vector_article_ids,
+    search_hybrid_article_ids,
+    JSONBytesResponse,
     get_paginated_articles,
+    get_paginated_ranked_articles,
+    get_paginated_ranked_article_ids,
+    get_paginated_ranked_page,
+    get_hot_article_ids,
+    increment_article_counter,
+    record_article_view,
+    update_hot_score,
+    get_preference_feed,
     get_serialized_article,
     update_article,
     get_paginated_comments,
@@ -20,16 +30,16 @@ from community.constants import (
     DELETED_BODY,
     DELETED_TITLE,
     ARTICLES_CACHE_KEY,
-    CACHE_TIMEOUT,
+    SEARCH_MODES,
 )
-from community.models import Article, ArticleLike, Course, ArticleCourse, ArticleView, ArticleSave, Comment
+from community.models import Article, ArticleLike, Course, ArticleCourse, ArticleSave, Comment
 from community.permissions import Article_IsAuthenticated
+from community.task import embed_article
 from community.serializers import ArticleSerializer
-from django.db.models import Case, When, F, Q
+from django.db.models import Q
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework import viewsets, status
-from django.core.cache import cache
 from django.urls import resolve
 from django.db import transaction
 
@@ -58,12 +68,8 @@ class ArticleViewSet(viewsets.ModelViewSet):
         self.perform_create(serializer)
         article_instance = serializer.instance
 
-        # Add the embedding to faiss
-        add_embedding_to_faiss(
-            get_faiss_index(),
-            article_instance.embedding_vector,
-            article_instance.id,
-        )
+        # Calculate the embedding in the background and add it to faiss
+        embed_article.delay(article_instance.id)
 
         # Link the foreign key for each course code if necessary
         course_code = request.data.get("course_code")
@@ -81,12 +87,9 @@ class ArticleViewSet(viewsets.ModelViewSet):
         else:
             article_instance.course_code = []
 
-        # Add article id to the cache
-        cache_key = ARTICLES_CACHE_KEY(user_instance.school.id, "article-list")
-        article_ids = cache.get(cache_key)
-        if article_ids:
-            article_ids.insert(0, article_instance.id)
-            cache.set(cache_key, article_ids, CACHE_TIMEOUT)
+        # Index the title, body and course codes for lexical search
+        update_article_search_vector(article_instance.id)
+        update_hot_score(article_instance)
 
         # Add extra properties for the response
         user_temp_name, user_static_points = get_set_temp_name_static_points(
@@ -106,44 +109,31 @@ class ArticleViewSet(viewsets.ModelViewSet):
         response_data = get_paginated_articles(
             request,
             self.get_queryset(),
-            ARTICLES_CACHE_KEY(request.user.school.id, resolve(request.path).view_name),
         )
 
-        return Response(response_data, status=status.HTTP_200_OK)
+        return JSONBytesResponse(response_data, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=["get"])
     def hot(self, request):
 
-        response_data = get_paginated_articles(
-            request,
-            self.get_queryset().order_by("-engagement_score"),
-            ARTICLES_CACHE_KEY(request.user.school.id, resolve(request.path).view_name),
+        # Page through the school's decayed hot ranking in Redis
+        def fetch_page(start_index, end_index):
+            return get_hot_article_ids(request.user.school.id, start_index, end_index)
+
+        response_data = get_paginated_ranked_page(
+            request, self.get_queryset(), fetch_page
         )
 
-        return Response(response_data, status=status.HTTP_200_OK)
+        return JSONBytesResponse(response_data, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=["get"])
     def preference(self, request):
-        user_instance = request.user
-
-        # Fetch Ids of the article based on the similarity
-        ids = search_similar_embeddings(
-            get_faiss_index(), user_instance.embedding_vector, len(self.get_queryset())
-        )
-
-        # Fetch the article based on the fetched id while maintaining the order
-        order = Case(*[When(pk=pk, then=pos) for pos, pk in enumerate(ids)])
-        queryset = self.get_queryset().filter(pk__in=ids).order_by(order)
-
-        response_data = get_paginated_articles(
-            request,
-            queryset,
-            ARTICLES_CACHE_KEY(
-                user_instance.school.id, resolve(request.path).view_name, user_instance.id
-            ),
+        # Serve a slice of the ranking materialized in the background
+        response_data = get_paginated_ranked_article_ids(
+            request, self.get_queryset(), get_preference_feed(request.user.id)
         )
 
-        return Response(response_data, status=status.HTTP_200_OK)
+        return JSONBytesResponse(response_data, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=["get"])
     def search(self, request):
@@ -155,28 +145,39 @@ class ArticleViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # Get embedding vectors for the search keywords
-        embedding_vector = get_embedding(search_content)
-
-        # Fetch Ids of the article based on the similarity
-        ids = search_similar_embeddings(
-            get_faiss_index(), embedding_vector, len(self.get_queryset())
-        )
-
-        # Fetch the article based on the fetched id while maintaining the order
-        order = Case(*[When(pk=pk, then=pos) for pos, pk in enumerate(ids)])
-        queryset = self.get_queryset().filter(pk__in=ids).order_by(order)
+        # Block unknown search modes
+        mode = request.GET.get("mode", "hybrid")
+        if mode not in SEARCH_MODES:
+            return Response(
+                {"detail": f"The mode must be one of {', '.join(SEARCH_MODES)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
+        # Fetch the k best matching article ids for the search keywords
         user_instance = request.user
-        response_data = get_paginated_articles(
+        partitions = get_visible_faiss_partitions(user_instance.school.id)
+
+        def fetch_ranked_ids(k):
+            if mode == "lexical":
+                return search_lexical_article_ids(self.get_queryset(), search_content, k)
+            if mode == "vector":
+                return search_vector_article_ids(search_content, partitions, k)
+            return search_hybrid_article_ids(
+                self.get_queryset(), search_content, partitions, k
+            )
+
+        response_data = get_paginated_ranked_articles(
             request,
-            queryset,
+            self.get_queryset(),
             ARTICLES_CACHE_KEY(
-                user_instance.school.id, resolve(request.path).view_name, search_content
+                user_instance.school.id,
+                resolve(request.path).view_name,
+                f"{mode}_{search_content}",
             ),
+            fetch_ranked_ids,
         )
 
-        return Response(response_data, status=status.HTTP_200_OK)
+        return JSONBytesResponse(response_data, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=["get"])
     def posted_articles(self, request, *args, **kwargs):        
@@ -184,10 +185,9 @@ class ArticleViewSet(viewsets.ModelViewSet):
         response_data = get_paginated_articles(
             request,
             self.get_queryset().filter(user=request.user),
-            ARTICLES_CACHE_KEY(request.user.school.id, resolve(request.path).view_name, request.user.id),
         )
 
-        return Response(response_data, status=status.HTTP_200_OK)
+        return JSONBytesResponse(response_data, status=status.HTTP_200_OK)
     
     @action(detail=False, methods=["get"])
     def commented_articles(self, request, *args, **kwargs):            
@@ -195,10 +195,9 @@ class ArticleViewSet(viewsets.ModelViewSet):
         response_data = get_paginated_articles(
             request,
             self.get_queryset().filter(comment__user=request.user).distinct(),
-            ARTICLES_CACHE_KEY(request.user.school.id, resolve(request.path).view_name, request.user.id),
         )
 
-        return Response(response_data, status=status.HTTP_200_OK)
+        return JSONBytesResponse(response_data, status=status.HTTP_200_OK)
     
     @action(detail=False, methods=["get"])
     def saved_articles(self, request, *args, **kwargs):            
@@ -206,10 +205,9 @@ class ArticleViewSet(viewsets.ModelViewSet):
         response_data = get_paginated_articles(
             request,
             self.get_queryset().filter(articlesave__user=request.user),
-            ARTICLES_CACHE_KEY(request.user.school.id, resolve(request.path).view_name, request.user.id),
         )
 
-        return Response(response_data, status=status.HTTP_200_OK)
+        return JSONBytesResponse(response_data, status=status.HTTP_200_OK)
     
     @action(detail=False, methods=["get"])
     def liked_articles(self, request, *args, **kwargs):            
@@ -217,10 +215,9 @@ class ArticleViewSet(viewsets.ModelViewSet):
         response_data = get_paginated_articles(
             request,
             self.get_queryset().filter(articlelike__user=request.user),
-            ARTICLES_CACHE_KEY(request.user.school.id, resolve(request.path).view_name, request.user.id),
         )
 
-        return Response(response_data, status=status.HTTP_200_OK)
+        return JSONBytesResponse(response_data, status=status.HTTP_200_OK)
 
     def update(self, request, *args, **kwargs):
         return Response(
@@ -263,21 +260,11 @@ class ArticleViewSet(viewsets.ModelViewSet):
         user_instance = request.user
         article_instance = self.get_object()
 
-        # Update user preference based on the embedding of article
-        updated_preference_vector = update_preference_vector(
-            user_instance.embedding_vector, article_instance.embedding_vector
-        )
-        Article.objects.filter(pk=article_instance.id).update(embedding_vector=updated_preference_vector)
+        # Queue the view, the user preference is updated in the background
+        record_preference_event(user_instance.id, article_instance.id)
 
-        # Create relational data
-        with transaction.atomic():
-            ArticleView.objects.get_or_create(
-                user=user_instance, article=article_instance
-            )
-        
-        # Update the article instance & shared article attributes cache
-        updated_fields = {"views_count": F("views_count") + 1}
-        update_article(article_instance, updated_fields)
+        # Count the view, the row and the counter are written in the background
+        record_article_view(user_instance.id, article_instance.id)
 
         # update the user specific cache
         update_user_viewed_article_cache(request, article_instance)
@@ -366,9 +353,8 @@ class ArticleViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_304_NOT_MODIFIED,
             )
         
-        # Update the article instance & shared article attributes cache
-        updated_fields = {"likes_count": F("likes_count") + 1}
-        update_article(article_instance, updated_fields)
+        # Count the like, the counter is flushed to the database in the background
+        increment_article_counter(article_instance.id, "likes_count")
 
         # update the user specific cache
         update_user_liked_article_cache(request, article_instance, True)
@@ -401,9 +387,8 @@ class ArticleViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_304_NOT_MODIFIED,
             )
         
-        # Update the article instance & shared article attributes cache
-        updated_fields = {"likes_count": F("likes_count") - 1}
-        update_article(article_instance, updated_fields)
+        # Count the unlike, the counter is flushed to the database in the background
+        increment_article_counter(article_instance.id, "likes_count", -1)
 
         # update the user specific cache
         update_user_liked_article_cache(request, article_instance, False)
@@ -1,7 +1,7 @@
 from community.utils import (
     get_paginated_comments,
-    update_article,
-    update_user_commented_article_cache,
+    increment_article_counter,
+    increment_comment_counter,
     add_comment,
     update_comment,
     update_user_liked_comments_cache,
@@ -14,7 +14,7 @@ from community.constants import DELETED_BODY
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework import viewsets, status
-from django.db.models import F, Q
+from django.db.models import Q
 from django.db import transaction
 
 
@@ -42,14 +42,14 @@ class CommentViewSet(viewsets.ModelViewSet):
         self.perform_create(serializer)
         comment_instance = serializer.instance
 
-        # Update the article & comment's instance & cache
-        updated_fields = {"comments_count": F("comments_count") + 1}
-        update_article(comment_instance.article, updated_fields)
-        update_user_commented_article_cache(request, comment_instance.article)
+        # Count the comment, the counters are flushed to the database in the background
+        increment_article_counter(comment_instance.article.id, "comments_count")
 
-        # Update the parent comment's instance & cache
+        # Count the reply on the parent comment as well
         if comment_instance.parent_comment:
-            update_comment(comment_instance.parent_comment, updated_fields)
+            increment_comment_counter(
+                comment_instance.parent_comment.id, "comments_count"
+            )
             if comment_instance.parent_comment.user != user_instance:
                 add_notification(
                     0,
@@ -149,8 +149,7 @@ class CommentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_304_NOT_MODIFIED,
             )
 
-        updated_fields = {"likes_count": F("likes_count") + 1}
-        update_comment(comment_instance, updated_fields)
+        increment_comment_counter(comment_instance.id, "likes_count")
         update_user_liked_comments_cache(comment_instance, user_instance, True)
 
         # Add notification
@@ -180,8 +179,7 @@ class CommentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_304_NOT_MODIFIED,
             )
 
-        updated_fields = {"likes_count": F("likes_count") - 1}
-        update_comment(comment_instance, updated_fields)
+        increment_comment_counter(comment_instance.id, "likes_count", -1)
         update_user_liked_comments_cache(comment_instance, user_instance, False)
 
         return Response({"detail":"The comment has been unliked by user."}, status=status.HTTP_200_OK)
@@ -0,0 +1,44 @@
+from django_redis.compressors.base import BaseCompressor
+from django_redis.serializers.base import BaseSerializer
+from django_redis.exceptions import CompressorError
+import zstandard
+import msgpack
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+class MsgPackSerializer(BaseSerializer):
+    """
+    msgpack instead of pickle for the cached payloads. Unlike the django-redis
+    one, it keeps integer dict keys (the comment caches are keyed by id) and
+    aware datetimes.
+    """
+
+    def dumps(self, value):
+        return msgpack.packb(value, use_bin_type=True, datetime=True)
+
+    def loads(self, value):
+        return msgpack.unpackb(value, raw=False, strict_map_key=False, timestamp=3)
+
+
+class ZstdCompressor(BaseCompressor):
+    """
+    Compresses the values of at least COMPRESS_MIN_LENGTH bytes, the small
+    ones are stored as is since the frame overhead outweighs the gain.
+    """
+
+    def __init__(self, options):
+        self.min_length = options.get("COMPRESS_MIN_LENGTH", 1024)
+        self.compressor = zstandard.ZstdCompressor(level=options.get("COMPRESS_LEVEL", 3))
+        self.decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, value):
+        if len(value) < self.min_length:
+            return value
+        return self.compressor.compress(value)
+
+    def decompress(self, value):
+        # Not compressed, the caller loads the value as is
+        if not value.startswith(ZSTD_MAGIC):
+            raise CompressorError
+        return self.decompressor.decompress(value)
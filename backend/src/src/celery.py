@@ -9,8 +9,9 @@ app = Celery("src")
 # Load task modules from all registered Django app configs
 app.config_from_object("django.conf:settings", namespace="CELERY")
 
-# Autodiscover tasks from installed apps
+# Autodiscover tasks from installed apps (the community app keeps them in task.py)
 app.autodiscover_tasks()
+app.autodiscover_tasks(related_name="task")
 
 @app.task(bind=True)
 def debug_task(self):
@@ -10,6 +10,14 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+from community.constants import (
+    FAISS_CHECKPOINT_INTERVAL,
+    PREFERENCE_FOLD_INTERVAL,
+    PREFERENCE_MATERIALIZE_INTERVAL,
+    HOT_DECAY_INTERVAL,
+    COUNTER_FLUSH_INTERVAL,
+    ARTICLE_VIEWS_FLUSH_INTERVAL,
+)
 from pathlib import Path
 from datetime import timedelta
 from decouple import config
@@ -47,6 +55,41 @@ CELERY_BROKER_URL = "redis://redis:6379/1"  # Change DB index if needed
 CELERY_RESULT_BACKEND = "redis://redis:6379/1"
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
+CELERY_BEAT_SCHEDULE = {
+    "checkpoint-faiss-index": {
+        "task": "community.task.checkpoint_faiss_index",
+        "schedule": FAISS_CHECKPOINT_INTERVAL,
+    },
+    "fold-preference-events": {
+        "task": "community.task.fold_preference_events",
+        "schedule": PREFERENCE_FOLD_INTERVAL,
+    },
+    "refresh-preference-feeds": {
+        "task": "community.task.refresh_preference_feeds",
+        "schedule": PREFERENCE_MATERIALIZE_INTERVAL,
+    },
+    "decay-hot-rankings": {
+        "task": "community.task.decay_hot_rankings",
+        "schedule": HOT_DECAY_INTERVAL,
+    },
+    "flush-counters": {
+        "task": "community.task.flush_counters",
+        "schedule": COUNTER_FLUSH_INTERVAL,
+    },
+    "flush-article-views": {
+        "task": "community.task.flush_article_views",
+        "schedule": ARTICLE_VIEWS_FLUSH_INTERVAL,
+    },
+}
+
+# FAISS Settings
+FAISS_INDEX_TYPE = config("FAISS_INDEX_TYPE", default="flat")  # flat, hnsw or ivfpq
+
+# View Tracking Settings
+UNIQUE_ARTICLE_VIEWS = config("UNIQUE_ARTICLE_VIEWS", default=False, cast=bool)
+
+# Embedding Settings
+EMBEDDING_BACKEND = config("EMBEDDING_BACKEND", default="openai")  # openai or local
 
 # Application definition
 
@@ -68,7 +111,13 @@ CACHES = {
         'LOCATION': 'redis://redis:6379/0',
         'OPTIONS': {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
-        }
+            'SERIALIZER': 'src.cache_serializers.MsgPackSerializer',
+            'COMPRESSOR': 'src.cache_serializers.ZstdCompressor',
+            'COMPRESS_MIN_LENGTH': 1024,
+            'COMPRESS_LEVEL': 3,
+        },
+        # Bumped with the serializer so pickled values are never read back
+        'VERSION': 2,
     }
 }
 
@@ -159,6 +208,8 @@ if 'test' in sys.argv:
             'NAME': ':memory:',  
         }
     }
+    CELERY_TASK_ALWAYS_EAGER = True
+    EMBEDDING_BACKEND = "local"
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators